@@ -0,0 +1,61 @@
+import json
+import os
+import platform
+import timeit
+
+
+"""
+Throughput benchmarks of the quoting hot paths, over fixed synthetic workloads
+(no network, no data files, the same numbers on every run).
+
+    python -m benchmarks                        # run them all, print ops/s
+    python -m benchmarks calculate rules        # only the benchmarks whose name has these words
+    python -m benchmarks -o results.json        # also write the results as JSON
+    python -m benchmarks --save                 # store the results as the baseline
+    python -m benchmarks --compare              # exit 1 if any is 20% slower than the baseline
+
+Baselines are machine dependent: save one on the machine you compare on.
+"""
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+BENCHMARKS = {}     # name --> (setup, ops)
+
+
+def benchmark(name, ops=1):
+    "registers setup() --> fn as a benchmark, where each fn() call does `ops` operations"
+    def register(setup):
+        BENCHMARKS[name] = (setup, ops)
+        return setup
+    return register
+
+
+def measure(fn, ops=1, repeat=5):
+    "best throughput of fn (ops per second) over `repeat` runs of ~0.2s"
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return ops * number / min(timer.repeat(repeat, number))
+
+
+def run(words=(), repeat=5):
+    "{name: ops per second} of the benchmarks whose name contains any of words (all by default)"
+    from . import bench_json, bench_loans, bench_rules     # noqa: F401, they register the benchmarks
+    return {name: measure(setup(), ops, repeat) for name, (setup, ops) in BENCHMARKS.items()
+            if not words or any(word in name for word in words)}
+
+
+def compare(results, baseline, threshold=0.2):
+    "{name: results / baseline} of the benchmarks that got more than threshold slower"
+    return {name: ops / baseline[name] for name, ops in results.items()
+            if baseline.get(name) and ops < baseline[name] * (1 - threshold)}
+
+
+def dump(results, path):
+    with open(path, 'w') as f:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                   'results': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)['results']
@@ -0,0 +1,35 @@
+import argparse
+import sys
+from . import BASELINE, compare, dump, load, run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='quoting throughput benchmarks')
+    parser.add_argument('words', nargs='*', help='only the benchmarks whose name has any of these')
+    parser.add_argument('-o', '--output', help='write the results as JSON here')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='exit 1 on regressions against the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown (0.2: 20%%)')
+    args = parser.parse_args(argv)
+
+    results = run(args.words, args.repeat)
+    baseline = load(args.baseline) if args.compare else {}
+    for name, ops in results.items():
+        ratio = f'  {ops / baseline[name]:6.2f}x' if baseline.get(name) else ''
+        print(f'{name:40} {ops:14,.1f} ops/s{ratio}')
+    if args.output:
+        dump(results, args.output)
+    if args.save:
+        dump(dict(load(args.baseline), **results) if args.words else results, args.baseline)
+    if args.compare:
+        slower = compare(results, baseline, args.threshold)
+        for name, ratio in slower.items():
+            print(f'REGRESSION {name}: {ratio:.2f}x the baseline', file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
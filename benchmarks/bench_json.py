@@ -0,0 +1,35 @@
+import datetime
+import decimal
+import json
+import random
+from json_multitype.json_multitype import MultitypeDecoder, MultitypeEncoder
+from . import benchmark
+
+
+def payload(count, tags, seed=0):
+    "an API-like document of count records, with a date and a decimal each when tags"
+    rnd = random.Random(seed)
+    records = []
+    for i in range(count):
+        day = datetime.date(2020, 1, 1) + datetime.timedelta(days=rnd.randrange(1000))
+        amount = decimal.Decimal(rnd.randrange(10 ** 7)) / 100
+        records.append({
+            'id': i, 'name': f'client {i}', 'active': rnd.random() < 0.5, 'score': rnd.random(),
+            'date': day if tags else day.isoformat(), 'amount': amount if tags else str(amount),
+            'tags': [rnd.choice('abcdef') for _ in range(3)],
+        })
+    return json.dumps({'count': count, 'records': records}, cls=MultitypeEncoder)
+
+
+for _tags in (False, True):
+    _name = 'tagged' if _tags else 'plain'
+
+    @benchmark(f'json.loads.{_name}.1000', ops=1000)
+    def _loads(tags=_tags):
+        text = payload(1000, tags)
+        return lambda: json.loads(text)
+
+    @benchmark(f'json.multitype.{_name}.1000', ops=1000)
+    def _multitype(tags=_tags):
+        text = payload(1000, tags)
+        return lambda: json.loads(text, cls=MultitypeDecoder)
@@ -0,0 +1,72 @@
+import numpy
+from loan_calculator.calculator import Product
+from . import benchmark
+
+
+EXPENSES = dict(
+    life=0.0003, fire=0.0002, sivr=0.00001, serv=50,
+    origination_pct=0.03, origination_min=1000, notary_pct=0.01, notary_min=300, notary_fixed=20,
+)
+
+CAPITALS = [1e5 + 37e3 * i for i in range(50)]     # from 100k to ~1.9M
+
+
+def product(depreciation='FR'):
+    return Product(tna=0.45, collateral=2e6, depreciation=depreciation, **EXPENSES)
+
+
+for _n in (12, 60, 120, 360):
+    @benchmark(f'calculate.FR.{_n}', ops=len(CAPITALS))
+    def _calculate(n=_n):
+        p = product()
+        return lambda: [p.calculate(k, n) for k in CAPITALS]
+
+
+@benchmark('calculate.AM.60', ops=len(CAPITALS))
+def _american():
+    p = product('AM')
+    return lambda: [p.calculate(k, 60) for k in CAPITALS]
+
+
+@benchmark('calculate_grid.50x4', ops=len(CAPITALS) * 4)
+def _grid():
+    p = product()
+    return lambda: p.calculate_grid(CAPITALS, [12, 60, 120, 360])
+
+
+@benchmark('plan.table.360')
+def _table():
+    p = product()
+    return lambda: p.repayment_plan(1e6, 360, table=True)
+
+
+@benchmark('plan.installments.360')
+def _installments():
+    p = product()
+    return lambda: p.repayment_plan(1e6, 360)
+
+
+@benchmark('cft.annuity.120', ops=len(CAPITALS))
+def _cft():
+    p = product()
+    return lambda: [p.cft(k, 120) for k in CAPITALS]
+
+
+@benchmark('cft.plan.120')
+def _cft_plan():
+    p = product()
+    plan = p.repayment_plan(1e6, 120, table=True)
+    return lambda: p.cft(1e6, 120, plan=plan)
+
+
+@benchmark('revert_capital', ops=len(CAPITALS))
+def _revert_capital():
+    p = product()
+    return lambda: [p.revert_capital(kd) for kd in CAPITALS]
+
+
+@benchmark('revert_capitals.10000', ops=10000)
+def _revert_capitals():
+    p = product()
+    kds = numpy.linspace(1e3, 3e6, 10000)
+    return lambda: p.revert_capitals(kds)
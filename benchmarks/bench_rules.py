@@ -0,0 +1,43 @@
+import random
+from types import SimpleNamespace
+from loan_calculator.overwriters import Overwriter, RuleSet
+from . import benchmark
+
+
+CODES = 'ABCDEFGH'
+
+
+def rule_text(size, seed=0):
+    "size pricing rules over code, term and score, the same ones for a given seed"
+    rnd = random.Random(seed)
+    lines = []
+    for _ in range(size):
+        code, term = rnd.choice(CODES), rnd.choice([12, 24, 36, 60, 120])
+        lo = rnd.randrange(0, 900, 100)
+        kind = rnd.random()
+        if kind < 0.5:
+            condition = f'cmp(code={code}, term.gte={term})'
+        elif kind < 0.8:
+            condition = f'between(score, {lo}..{lo + 200})'
+        else:
+            condition = f'cmp(code={code}, score.lt={lo})'
+        lines.append(f'pricing.{condition}: tna={rnd.randrange(20, 80) / 100}, fee={rnd.randrange(0, 500)}')
+    return '\n'.join(lines)
+
+
+def applications(count, seed=1):
+    rnd = random.Random(seed)
+    return [SimpleNamespace(code=rnd.choice(CODES), term=rnd.choice([12, 24, 36, 60, 120, 360]),
+                            score=rnd.randrange(0, 1000), tna=0.5, fee=100) for _ in range(count)]
+
+
+for _size in (10, 1000):
+    @benchmark(f'rules.trigger.{_size}', ops=100)
+    def _trigger(size=_size):
+        rules, apps = RuleSet(rule_text(size)), applications(100)
+        return lambda: [Overwriter.trigger(rules, 'pricing', x) for x in apps]
+
+    @benchmark(f'rules.parse.{_size}')
+    def _parse(size=_size):
+        text = rule_text(size)
+        return lambda: RuleSet(text)
@@ -0,0 +1,21 @@
+import os
+import tempfile
+
+from unittest import TestCase
+from . import compare, dump, load, run
+from .bench_rules import rule_text
+
+
+class Benchmarks(TestCase):
+    def test_compare(self):
+        baseline = {'a': 100.0, 'b': 100.0, 'c': 100.0}
+        self.assertEqual(compare({'a': 85.0, 'b': 70.0, 'd': 1.0}, baseline, threshold=0.2), {'b': 0.7})
+
+    def test_run(self):
+        self.assertEqual(rule_text(50), rule_text(50))
+        results = run(['revert_capitals', 'plan.table'], repeat=1)
+        self.assertEqual(sorted(results), ['plan.table.360', 'revert_capitals.10000'])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'results.json')
+            dump(results, path)
+            self.assertEqual(load(path), results)
@@ -0,0 +1,300 @@
+import datetime
+import decimal
+import json
+import struct
+from .json_multitype import _BUILTIN, CODERS, DECODERS, coder_of, numpy
+
+
+"""
+Compact binary twin of MultitypeEncoder/MultitypeDecoder, length prefixed like MessagePack
+(big endian, struct packed):
+
+    0x00-0x7f, 0xe0-0xff    small ints              0xd3 int64, 0xc1 big int
+    0xc0, 0xc2, 0xc3        None, False, True       0xcb float64
+    0xa0-0xbf, 0xdb         str (utf-8)             0xc6 bytes
+    0x90-0x9f, 0xdd         array                   0x80-0x8f, 0xdf map (str keys)
+    0xc7 code ...           extension: date, datetime, decimal, ndarray,
+                            or any registered type as its key and its JSON value
+
+bytes, date, datetime, decimal and ndarray have their own codes while they keep the coding
+they come with; register() another one and they are written with it, as JSON would.
+
+Values decode to what MultitypeDecoder returns for their JSON: tuples become lists,
+keys become str, and a map with a single "_<key>" is decoded by that key.
+
+    data = dumps(obj); loads(data) == json.loads(json.dumps(obj, cls=MultitypeEncoder), cls=MultitypeDecoder)
+    dump_iter(objects, f); for x in load_iter(f): ...     # f: a binary file, bytes or an mmap
+"""
+
+EXT_CODING, EXT_DATE, EXT_DATETIME, EXT_DECIMAL, EXT_NDARRAY = range(5)
+
+_DATE = struct.Struct('>HBB')
+_DATETIME = struct.Struct('>HBBBBBI')
+_INT64 = struct.Struct('>q')
+_FLOAT = struct.Struct('>d')
+_SIZE = struct.Struct('>I')
+
+
+class DecodingError(ValueError):
+    pass
+
+
+def _size(out, n, fix, limit, code):
+    "a fixed size code for small n, else code + uint32"
+    if n < limit:
+        out.append(fix | n)
+    else:
+        out.append(code)
+        out += _SIZE.pack(n)
+
+
+def _str(out, x):
+    data = x.encode()
+    _size(out, len(data), 0xa0, 32, 0xdb)
+    out += data
+
+
+def _int(out, x):
+    if -32 <= x < 128:
+        out.append(x & 0xff)
+    elif -1 << 63 <= x < 1 << 63:
+        out.append(0xd3)
+        out += _INT64.pack(x)
+    else:
+        data = x.to_bytes((x.bit_length() + 8) // 8, 'big', signed=True)
+        out.append(0xc1)
+        out += _SIZE.pack(len(data)) + data
+
+
+def _key(x):
+    "dict keys as json writes them"
+    if isinstance(x, str):
+        return x
+    if x is None or isinstance(x, (int, float)):
+        return json.dumps(x)
+    raise TypeError(f'keys must be str, int, float, bool or None, not {type(x).__name__}')
+
+
+def _builtin(cls):
+    "whether cls still has the coding it comes with"
+    coder, builtin = CODERS.get(cls), _BUILTIN.get(cls)
+    return coder is builtin or (
+        coder is not None and builtin is not None and
+        (coder.key, coder.encoder, coder.decoder) == (builtin.key, builtin.encoder, builtin.decoder))
+
+
+def _ext(out, code):
+    out.append(0xc7)
+    out.append(code)
+
+
+def _encode(out, x):
+    if isinstance(x, str):
+        _str(out, x)
+    elif x is None:
+        out.append(0xc0)
+    elif x is True or x is False:
+        out.append(0xc3 if x else 0xc2)
+    elif isinstance(x, int):
+        _int(out, int(x))
+    elif isinstance(x, float):
+        out.append(0xcb)
+        out += _FLOAT.pack(x)
+    elif isinstance(x, (list, tuple)):
+        _size(out, len(x), 0x90, 16, 0xdd)
+        for y in x:
+            _encode(out, y)
+    elif isinstance(x, dict):
+        _size(out, len(x), 0x80, 16, 0xdf)
+        for k, v in x.items():
+            _str(out, _key(k))
+            _encode(out, v)
+    elif type(x) is bytes and _builtin(bytes):
+        out.append(0xc6)
+        out += _SIZE.pack(len(x)) + x
+    elif type(x) is datetime.datetime and x.tzinfo is None and _builtin(datetime.datetime):
+        _ext(out, EXT_DATETIME)
+        out += _DATETIME.pack(x.year, x.month, x.day, x.hour, x.minute, x.second, x.microsecond)
+    elif type(x) is datetime.date and _builtin(datetime.date):
+        _ext(out, EXT_DATE)
+        out += _DATE.pack(x.year, x.month, x.day)
+    elif type(x) is decimal.Decimal and _builtin(decimal.Decimal):
+        _ext(out, EXT_DECIMAL)
+        _str(out, str(x))
+    elif (numpy is not None and type(x) is numpy.ndarray and not (x.dtype.hasobject or x.dtype.fields) and
+          _builtin(numpy.ndarray)):
+        _ext(out, EXT_NDARRAY)
+        _str(out, x.dtype.str)
+        _encode(out, list(x.shape))
+        _encode(out, numpy.ascontiguousarray(x).tobytes())
+    else:
+        coder = coder_of(type(x))
+        if coder is None:
+            raise TypeError(f'Object of type {type(x).__name__} is not serializable')
+        _ext(out, EXT_CODING)
+        _str(out, coder.key)
+        _encode(out, coder.encoder(x))
+
+
+def dumps(obj):
+    out = bytearray()
+    _encode(out, obj)
+    return bytes(out)
+
+
+def dump(obj, fp):
+    fp.write(dumps(obj))
+
+
+def dump_iter(objects, fp):
+    "writes the objects one after the other. Returns how many"
+    count = 0
+    for x in objects:
+        fp.write(dumps(x))
+        count += 1
+    return count
+
+
+class _BufferReader():
+    "reads a bytes-like object (bytes, mmap...) without copying"
+    def __init__(self, data):
+        self.data = memoryview(data).cast('B')
+        self.pos = 0
+
+    def take(self, n):
+        end = self.pos + n
+        if end > len(self.data):
+            raise DecodingError(f'truncated data at {self.pos}')
+        chunk = self.data[self.pos:end]
+        self.pos = end
+        return chunk
+
+    def at_end(self):
+        return self.pos >= len(self.data)
+
+
+class _FileReader():
+    "reads a binary file object"
+    def __init__(self, fp):
+        self.fp = fp
+        self.next = b''
+
+    def take(self, n):
+        chunk, self.next = self.next, b''
+        while len(chunk) < n:
+            more = self.fp.read(n - len(chunk))
+            if not more:
+                raise DecodingError('truncated data')
+            chunk += more
+        return chunk
+
+    def at_end(self):
+        self.next = self.fp.read(1)
+        return not self.next
+
+
+def _unpack(reader, s):
+    return s.unpack(reader.take(s.size))
+
+
+def _text(reader, n):
+    return str(reader.take(n), 'utf-8')
+
+
+def _decode(reader):
+    code = reader.take(1)[0]
+    if code < 0x80:
+        return code
+    if code >= 0xe0:
+        return code - 0x100
+    if code < 0x90:
+        return _map(reader, code & 0x0f)
+    if code < 0xa0:
+        return [_decode(reader) for _ in range(code & 0x0f)]
+    if code < 0xc0:
+        return _text(reader, code & 0x1f)
+    decode = _DECODE.get(code)
+    if decode is None:
+        raise DecodingError(f'unknown code {code:#x}')
+    return decode(reader)
+
+
+def _map(reader, n):
+    obj = {}
+    for _ in range(n):
+        key = _decode(reader)
+        obj[key] = _decode(reader)
+    if n == 1:
+        (key, value), = obj.items()
+        decoder = DECODERS.get(key)
+        if decoder is not None:
+            return decoder(value)
+    return obj
+
+
+def _big(reader):
+    n, = _unpack(reader, _SIZE)
+    return int.from_bytes(reader.take(n), 'big', signed=True)
+
+
+def _ext_value(reader):
+    code = reader.take(1)[0]
+    if code == EXT_DATE:
+        return datetime.date(*_unpack(reader, _DATE))
+    if code == EXT_DATETIME:
+        return datetime.datetime(*_unpack(reader, _DATETIME))
+    if code == EXT_DECIMAL:
+        return decimal.Decimal(_decode(reader))
+    if code == EXT_CODING:
+        key = _decode(reader)
+        decoder = DECODERS.get(key)
+        value = _decode(reader)
+        return {key: value} if decoder is None else decoder(value)    # unknown: as its JSON
+    if code == EXT_NDARRAY and numpy is not None:
+        dtype, shape, data = _decode(reader), _decode(reader), _decode(reader)
+        return numpy.frombuffer(data, dtype=numpy.dtype(dtype)).reshape(shape)
+    raise DecodingError(f'unknown extension {code}')
+
+
+_DECODE = {
+    0xc0: lambda reader: None,
+    0xc2: lambda reader: False,
+    0xc3: lambda reader: True,
+    0xd3: lambda reader: _unpack(reader, _INT64)[0],
+    0xc1: _big,
+    0xcb: lambda reader: _unpack(reader, _FLOAT)[0],
+    0xdb: lambda reader: _text(reader, _unpack(reader, _SIZE)[0]),
+    0xc6: lambda reader: bytes(reader.take(_unpack(reader, _SIZE)[0])),
+    0xdd: lambda reader: [_decode(reader) for _ in range(_unpack(reader, _SIZE)[0])],
+    0xdf: lambda reader: _map(reader, _unpack(reader, _SIZE)[0]),
+    0xc7: _ext_value,
+}
+
+
+def loads(data):
+    "the value of a bytes-like object (bytes, memoryview, mmap...)"
+    reader = _BufferReader(data)
+    obj = _decode(reader)
+    if not reader.at_end():
+        raise DecodingError(f'extra data at {reader.pos}')
+    return obj
+
+
+def load(fp):
+    "the next value of a binary file"
+    return _decode(_FileReader(fp))
+
+
+def load_iter(source):
+    "the values of a binary file, or of a bytes-like object such as an mmap, one by one"
+    if hasattr(source, 'read') and not hasattr(source, 'find'):
+        reader = _FileReader(source)
+        while not reader.at_end():
+            yield _decode(reader)
+        return
+    reader = _BufferReader(source)
+    try:
+        while not reader.at_end():
+            yield _decode(reader)
+    finally:
+        reader.data.release()       # so the mmap can be closed, even half way
@@ -1,6 +1,29 @@
+import base64
 import datetime
 import decimal
 import json
+import uuid
+
+try:
+    import numpy
+except ImportError:     # no _ndarray coding
+    numpy = None
+
+
+"""
+JSON encoder/decoder for more types: objects are encoded as {"_<key>": value}.
+
+Types are looked up in a registry, exact type first and then along the MRO (cached per type).
+Add your own with register(), e.g.
+    register('uuid', uuid.UUID, str, uuid.UUID)
+
+MultitypeDecoder looks for tags in the text first: documents without any are decoded
+by the plain json scanner, with no Python call per object.
+"""
+
+CODERS = {}         # type --> JsonCoding (a coding can have many types)
+DECODERS = {}       # "_<key>" --> decoder
+_dispatch = {}      # type --> JsonCoding of its nearest registered class (or None)
 
 
 class JsonCoding:
@@ -25,43 +48,101 @@ class JsonCoding:
     def to_python(cls, obj):
         if len(obj) != 1:
             return obj
-        for x in cls.coders():
-            if x.key in obj:
-                return x.decoder(obj[x.key])
-        return obj
+        (key, value), = obj.items()
+        decoder = DECODERS.get(key)
+        return obj if decoder is None else decoder(value)
 
     @classmethod
     def coders(cls):
-        return [
-            cls(
-                key='datetime',
-                type=datetime.datetime,
-                encoder=lambda x: x.isoformat(),
-                decoder=datetime.datetime.fromisoformat,
-            ),
-            cls(
-                key='date',
-                type=datetime.date,
-                encoder=lambda x: x.isoformat(),
-                decoder=datetime.date.fromisoformat,
-            ),
-            cls(
-                key='decimal',
-                type=decimal.Decimal,
-                encoder=str,
-                decoder=decimal.Decimal,
-            ),
-        ]
+        "the registered codings"
+        return list(dict.fromkeys(CODERS.values()))
+
+
+def register(key, type, encoder, decoder):
+    """encodes the objects of type (a type or a tuple of them, and their subclasses)
+    as {"_<key>": encoder(obj)}, decoded with decoder(value).
+    Replaces any previous coding of those types. A key can only belong to one coding:
+    using the key of other types raises ValueError (register them together instead)"""
+    coder = JsonCoding(key, type, encoder, decoder)
+    types = type if isinstance(type, tuple) else (type,)
+    others = [x for x, old in CODERS.items() if old.key == coder.key and x not in types]
+    if others:
+        raise ValueError(f"'{key}' is already the key of {others}")
+    replaced = {CODERS.pop(x).key for x in types if x in CODERS}
+    for x in types:
+        CODERS[x] = coder
+    in_use = {x.key for x in CODERS.values()}
+    for old_key in replaced - in_use:
+        del DECODERS[old_key]
+    DECODERS[coder.key] = decoder
+    _dispatch.clear()
+    return coder
+
+
+def tagged(s):
+    "whether the JSON text s may have tags: a key starting with '_' (maybe escaped)"
+    return '"_' in s or '\\u005' in s
+
+
+def coder_of(cls):
+    "the JsonCoding for objects of class cls, or None"
+    try:
+        return _dispatch[cls]
+    except KeyError:
+        coder = _dispatch[cls] = next((CODERS[x] for x in cls.__mro__ if x in CODERS), None)
+        return coder
+
+
+register('datetime', datetime.datetime, lambda x: x.isoformat(), datetime.datetime.fromisoformat)
+register('date', datetime.date, lambda x: x.isoformat(), datetime.date.fromisoformat)
+register('decimal', decimal.Decimal, str, decimal.Decimal)
+register('uuid', uuid.UUID, str, uuid.UUID)
+
+
+def _b64encode(x):
+    return base64.b64encode(x).decode('ascii')
+
+
+def _bytes_to_json(x):
+    return _b64encode(x if type(x) is bytes else x.tobytes())
+
+
+register('bytes', (bytes, memoryview), _bytes_to_json, base64.b64decode)
+register('bytearray', bytearray, _b64encode, lambda x: bytearray(base64.b64decode(x)))
+
+
+def ndarray_to_json(a):
+    "dtype, shape and the base64 of the raw (C ordered) buffer"
+    if a.dtype.hasobject or a.dtype.fields:
+        raise TypeError(f'arrays of {a.dtype} are not JSON serializable')
+    return {'dtype': a.dtype.str, 'shape': list(a.shape), 'data': _b64encode(numpy.ascontiguousarray(a))}
+
+
+def ndarray_from_json(x):
+    "a read only array over the decoded buffer"
+    return numpy.frombuffer(base64.b64decode(x['data']), dtype=numpy.dtype(x['dtype'])).reshape(x['shape'])
+
+
+if numpy is not None:
+    register('ndarray', numpy.ndarray, ndarray_to_json, ndarray_from_json)
+
+_BUILTIN = dict(CODERS)     # type --> the coding it comes with (binary has its own codes for them)
 
 
 class MultitypeEncoder(json.JSONEncoder):
     def default(self, obj):
-        for coder in JsonCoding.coders():
-            if coder.its_my_type(obj):
-                return coder.to_json(obj)
+        coder = coder_of(type(obj))
+        if coder is not None:
+            return coder.to_json(obj)
         return super().default(obj)
 
 
 class MultitypeDecoder(json.JSONDecoder):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, object_hook=JsonCoding.to_python, **kwargs)
+        self.plain = json.JSONDecoder(*args, **kwargs)
+
+    def decode(self, s, *args, **kwargs):
+        if tagged(s):
+            return super().decode(s, *args, **kwargs)
+        return self.plain.decode(s, *args, **kwargs)
@@ -0,0 +1,150 @@
+import codecs
+import io
+import json
+import re
+from json.decoder import WHITESPACE
+from .json_multitype import MultitypeDecoder, MultitypeEncoder, tagged
+
+
+"""
+Streaming multitype JSON, with bounded memory whatever the size of the file.
+
+    dump_iter(records, f)           # newline delimited JSON (one document per line)
+    for x in load_iter(f): ...
+
+    dump_array(records, f)          # a single JSON array, written element by element
+    for x in iter_array(f): ...     # its elements, as they are parsed
+
+Files can be text or binary (utf-8).
+"""
+
+CHUNKSIZE = 1 << 16
+
+
+def _writer(fp):
+    "fp.write for str, encoding to utf-8 on binary files"
+    if isinstance(fp, (io.RawIOBase, io.BufferedIOBase)):
+        return lambda s: fp.write(s.encode())
+    return fp.write
+
+
+def dump_iter(objects, fp, **kwargs):
+    "writes each object as a line of JSON. Returns how many"
+    encoder = MultitypeEncoder(**kwargs)
+    write = _writer(fp)
+    count = 0
+    for x in objects:
+        write(encoder.encode(x) + '\n')
+        count += 1
+    return count
+
+
+def load_iter(fp, **kwargs):
+    "the objects of a newline delimited JSON file (blank lines are skipped)"
+    decoder = MultitypeDecoder(**kwargs)
+    for line in fp:
+        if isinstance(line, bytes):
+            line = line.decode()
+        if line.strip():
+            yield decoder.decode(line)
+
+
+def dump_array(objects, fp, **kwargs):
+    "writes the objects as a JSON array, one element at a time. Returns how many"
+    encoder = MultitypeEncoder(**kwargs)
+    write = _writer(fp)
+    count = 0
+    write('[')
+    for x in objects:
+        write((',\n' if count else '\n') + encoder.encode(x))
+        count += 1
+    write('\n]\n' if count else ']\n')
+    return count
+
+
+def _reader(fp):
+    "read(n) --> str: the next characters of a text or binary (utf-8) file, '' at its end"
+    decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def read(n):
+        while True:
+            chunk = fp.read(n)
+            if not isinstance(chunk, bytes):
+                return chunk
+            text = decoder.decode(chunk, final=not chunk)
+            if text or not chunk:
+                return text
+    return read
+
+
+def _skip(s, i):
+    "the index of the first non whitespace from i"
+    return WHITESPACE.match(s, i).end()
+
+
+def _cut(e):
+    "whether the decoding error e may only be the end of the buffer cutting a value"
+    if e.msg.startswith('Unterminated string'):
+        return True
+    rest = e.doc[e.pos:]
+    if e.msg.startswith('Invalid \\uXXXX'):
+        return len(rest) < 5
+    return _NUMBER.fullmatch(rest) is not None or any(x.startswith(rest) for x in _LITERALS)
+
+
+_NUMBER = re.compile(r'[-+0-9.eE]*')
+_LITERALS = ('true', 'false', 'null', 'NaN', 'Infinity', '-Infinity')
+
+
+def iter_array(fp, chunksize=CHUNKSIZE, **kwargs):
+    """the elements of the top level JSON array of fp, as they are parsed.
+    Reads twice as much each time an element doesn't fit in the buffer, and raises as soon
+    as an element is malformed (but for an unterminated string, that runs to the end)"""
+    multitype = MultitypeDecoder(**kwargs)
+    read = _reader(fp)
+    buffer, i, eof, size = '', 0, False, chunksize
+
+    def more(grow=False):
+        "reads the next chunk, dropping what was parsed. False at the end of the file"
+        nonlocal buffer, i, eof, decoder, size
+        size = size * 2 if grow else chunksize
+        chunk = read(size)
+        eof = not chunk
+        buffer = buffer[i:] + chunk
+        i = 0
+        decoder = multitype if tagged(buffer) else multitype.plain
+        return not eof
+
+    decoder = multitype.plain
+    while _skip(buffer, i) == len(buffer) and more():
+        pass
+    i = _skip(buffer, i)
+    if buffer[i:i + 1] != '[':
+        raise json.JSONDecodeError('Expecting a JSON array', buffer, i)
+    i += 1
+    comma = after_comma = False     # a ',' is expected / was just read
+    while True:
+        i = _skip(buffer, i)
+        if i == len(buffer):
+            if not more():
+                raise json.JSONDecodeError('Unterminated array', buffer, i)
+            continue
+        if buffer[i] == ']' and not after_comma:
+            return
+        if comma:
+            if buffer[i] != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, i)
+            i += 1
+            comma, after_comma = False, True
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, i)
+        except json.JSONDecodeError as e:
+            if _cut(e) and more(grow=True):
+                continue
+            raise
+        if not eof and _NUMBER.fullmatch(buffer, end) is not None:
+            more(grow=True)     # a number could go on in the next chunk
+            continue
+        yield value
+        i, comma, after_comma = end, True, False
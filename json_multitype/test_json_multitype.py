@@ -1,9 +1,15 @@
 import datetime
 import decimal
+import io
 import json
+import mmap
+import tempfile
+import uuid
 
-from unittest import TestCase
-from .json_multitype import MultitypeEncoder, MultitypeDecoder
+from unittest import TestCase, mock, skipUnless
+from . import binary
+from .streaming import dump_array, dump_iter, iter_array, load_iter
+from .json_multitype import CODERS, DECODERS, JsonCoding, MultitypeEncoder, MultitypeDecoder, coder_of, register, tagged, _dispatch, numpy
 
 
 class MultitypeJsonEncoders(TestCase):
@@ -45,3 +51,209 @@ class MultitypeJsonEncoders(TestCase):
         encoded_data = json.dumps(data, cls=MultitypeEncoder)
         decoded_data = json.loads(encoded_data, cls=MultitypeDecoder)
         self.assertEqual(data, decoded_data)
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+    def __eq__(self, other):
+        return (self.x, self.y) == (other.x, other.y)
+
+
+class Point3(Point):
+    pass
+
+
+class Registry(TestCase):
+    def tearDown(self):
+        CODERS.pop(Point, None)
+        DECODERS.pop('_point', None)
+        _dispatch.clear()
+
+    def test_register(self):
+        register('point', Point, lambda p: [p.x, p.y], lambda x: Point(*x))
+        data = {"points": [Point(1, 2), Point3(3, 4)], "aDate": datetime.date(2021, 12, 31)}
+        encoded_data = json.dumps(data, cls=MultitypeEncoder)
+        self.assertIn('{"_point": [3, 4]}', encoded_data)
+        self.assertEqual(json.loads(encoded_data, cls=MultitypeDecoder), data)
+        self.assertIs(coder_of(Point3), CODERS[Point])
+        self.assertEqual(JsonCoding.coders()[-1].key, '_point')
+
+    def test_keys(self):
+        with self.assertRaises(ValueError):
+            register('bytes', Point, str, str)
+        bytes_coder = CODERS[bytes]
+        try:
+            register('mv', memoryview, bytes, bytes)    # bytes keeps its key
+            self.assertEqual(json.loads(json.dumps({"x": b"hi"}, cls=MultitypeEncoder), cls=MultitypeDecoder), {"x": b"hi"})
+        finally:
+            register('bytes', bytes_coder.type, bytes_coder.encoder, bytes_coder.decoder)
+        self.assertNotIn('_mv', DECODERS)
+
+    def test_dispatch(self):
+        self.assertEqual(coder_of(datetime.datetime).key, '_datetime')
+        self.assertEqual(coder_of(datetime.date).key, '_date')
+        self.assertIsNone(coder_of(Point))
+        self.assertEqual(JsonCoding.to_python({'_other': 1}), {'_other': 1})
+        with self.assertRaises(TypeError):
+            json.dumps(Point(1, 2), cls=MultitypeEncoder)
+
+
+class FastPath(TestCase):
+    def test_untagged(self):
+        text = json.dumps({"a": [1, 2.5, {"b": "x_"}], "c": None})
+        decoder = MultitypeDecoder(parse_float=decimal.Decimal)
+        with mock.patch.object(decoder, 'plain', wraps=decoder.plain) as plain:
+            self.assertEqual(decoder.decode(text), {"a": [1, decimal.Decimal("2.5"), {"b": "x_"}], "c": None})
+        plain.decode.assert_called_once()
+
+    def test_tagged(self):
+        self.assertFalse(tagged('{"date": "2021-12-31"}'))
+        self.assertEqual(json.loads('{"_other": 1}', cls=MultitypeDecoder), {"_other": 1})
+        self.assertEqual(json.loads('{"\\u005fdate": "2021-12-31"}', cls=MultitypeDecoder), datetime.date(2021, 12, 31))
+        text = '[{"_date": "2021-12-31"}, {"_date": "2021-12-31", "other": 1}]'
+        self.assertEqual(json.loads(text, cls=MultitypeDecoder),
+                         [datetime.date(2021, 12, 31), {"_date": "2021-12-31", "other": 1}])
+
+
+class Streaming(TestCase):
+    RECORDS = [
+        {"id": i, "aDate": datetime.date(2021, 1, 1 + i % 28), "amount": decimal.Decimal(f"{i}.25"), "tags": ["_x"] * (i % 3)}
+        for i in range(200)
+    ] + [[], "end", 1.5e300, -7]
+
+    def test_ndjson(self):
+        for f in [io.StringIO(), io.BytesIO()]:
+            self.assertEqual(dump_iter(iter(self.RECORDS), f), len(self.RECORDS))
+            f.seek(0)
+            self.assertEqual(list(load_iter(f)), self.RECORDS)
+
+    def test_array(self):
+        for f in [io.StringIO(), io.BytesIO()]:
+            dump_array(iter(self.RECORDS), f)
+            f.seek(0)
+            self.assertEqual(json.loads(f.read(), cls=MultitypeDecoder), self.RECORDS)
+            for chunksize in [1, 7, 64, 1 << 16]:
+                f.seek(0)
+                self.assertEqual(list(iter_array(f, chunksize=chunksize)), self.RECORDS)
+
+        self.assertEqual(list(iter_array(io.StringIO(' [ 12 , 345,{"_decimal": "1.5"} ]'), chunksize=2)),
+                         [12, 345, decimal.Decimal("1.5")])
+        self.assertEqual(list(iter_array(io.StringIO('[]'))), [])
+        self.assertEqual(list(iter_array(io.BytesIO('["ñandú", 1.5e3, true]'.encode()), chunksize=1)),
+                         ["ñandú", 1.5e3, True])
+        for bad in ['', '{}', '[1, 2', '[1 2]', '[1,, 2]', '[1,]', '[tru]', '[{"a": "\\u12"}]']:
+            with self.assertRaises(json.JSONDecodeError):
+                list(iter_array(io.StringIO(bad), chunksize=3))
+
+    def test_array_reads(self):
+        big = json.dumps(["x" * 100000, [1] * 20000])
+        f = io.StringIO(big)
+        with mock.patch.object(f, 'read', wraps=f.read) as read:
+            self.assertEqual(list(iter_array(f, chunksize=64)), json.loads(big))
+        self.assertLess(read.call_count, 40)        # not size / chunksize
+
+        f = io.StringIO('[1, {"a": bad}, ' + ', '.join(['2'] * 100000) + ']')
+        with mock.patch.object(f, 'read', wraps=f.read) as read:
+            with self.assertRaises(json.JSONDecodeError):
+                list(iter_array(f, chunksize=64))
+        self.assertEqual(read.call_count, 1)        # raised without reading the rest
+
+
+class BinaryCoders(TestCase):
+    def test_bytes(self):
+        data = {"bytes": b"\x00\xffabc", "bytearray": bytearray(b"xyz"), "uuid": uuid.UUID(int=12345)}
+        decoded_data = json.loads(json.dumps(data, cls=MultitypeEncoder), cls=MultitypeDecoder)
+        self.assertEqual(decoded_data, data)
+        self.assertIsInstance(decoded_data["bytearray"], bytearray)
+        self.assertEqual(json.loads(json.dumps(memoryview(b"abc"), cls=MultitypeEncoder), cls=MultitypeDecoder), b"abc")
+        self.assertIs(coder_of(memoryview), coder_of(bytes))
+        self.assertEqual(len(JsonCoding.coders()), len(set(JsonCoding.coders())))
+
+    @skipUnless(numpy, 'numpy is not installed')
+    def test_ndarray(self):
+        arrays = [
+            numpy.arange(12, dtype=numpy.float64).reshape(3, 4) / 7,
+            numpy.arange(12, dtype='>i4').reshape(3, 4).T,      # not contiguous, big endian
+            numpy.array(3.5),
+            numpy.zeros((0, 5), dtype=numpy.int8),
+            numpy.array([1 + 2j, numpy.nan]),
+            numpy.array([True, False]),
+        ]
+        encoded_data = json.dumps({"arrays": arrays}, cls=MultitypeEncoder)
+        for a, b in zip(arrays, json.loads(encoded_data, cls=MultitypeDecoder)["arrays"]):
+            self.assertEqual((b.dtype, b.shape), (a.dtype, a.shape))
+            self.assertEqual(b.tobytes(), a.tobytes())
+        with self.assertRaises(TypeError):
+            json.dumps(numpy.array([None]), cls=MultitypeEncoder)
+
+
+class Binary(TestCase):
+    DATA = {
+        "ints": [0, 127, 128, -32, -33, 2 ** 63 - 1, -2 ** 63, 2 ** 80, -2 ** 80],
+        "floats": [0.1, -1e300], "strings": ["", "x" * 31, "ñ" * 40], "flags": [None, True, False],
+        "aDate": datetime.date(2021, 12, 31), "aDatetime": datetime.datetime(2021, 12, 31, 12, 59, 1, 5),
+        "aware": datetime.datetime(2021, 12, 31, tzinfo=datetime.timezone.utc),
+        "aDecimal": decimal.Decimal("3.1415"), "uuid": uuid.UUID(int=7), "bytes": b"\x00\xff",
+        "tuple": (1, [2, {}]), 10: "int key", "tag": {"_date": "2021-12-31"}, "big": list(range(20)),
+        "map": {str(i): i for i in range(20)},
+    }
+
+    def test_same_as_json(self):
+        want = json.loads(json.dumps(self.DATA, cls=MultitypeEncoder), cls=MultitypeDecoder)
+        data = binary.dumps(self.DATA)
+        self.assertEqual(binary.loads(data), want)
+        self.assertEqual(binary.loads(memoryview(data)), want)
+        self.assertLess(len(data), len(json.dumps(self.DATA, cls=MultitypeEncoder)))
+
+    @skipUnless(numpy, 'numpy is not installed')
+    def test_ndarray(self):
+        a = numpy.arange(6, dtype='<i2').reshape(2, 3).T
+        b = binary.loads(binary.dumps(a))
+        self.assertEqual((b.dtype, b.shape, b.tobytes()), (a.dtype, a.shape, a.tobytes()))
+
+    def test_errors(self):
+        data = binary.dumps(self.DATA)
+        for bad in [data[:-1], data + b"\x00", b"\xc7\xff", b"\xd4"]:
+            with self.assertRaises(binary.DecodingError):
+                binary.loads(bad)
+        with self.assertRaises(TypeError):
+            binary.dumps(object())
+        with self.assertRaises(TypeError):
+            binary.dumps({(1, 2): 3})
+
+    def test_registry(self):
+        data = {"aDate": datetime.date(2021, 12, 31), "points": [Point(1, 2)]}
+        date_coder = CODERS[datetime.date]
+        try:
+            register('date', datetime.date, lambda x: x.toordinal(), datetime.date.fromordinal)
+            register('point', Point, lambda p: [p.x, p.y], lambda x: Point(*x))
+            want = json.loads(json.dumps(data, cls=MultitypeEncoder), cls=MultitypeDecoder)
+            encoded = binary.dumps(data)
+            self.assertEqual(binary.loads(encoded), want)
+            self.assertIn(b"_date", encoded)
+            points = binary.dumps(data["points"])
+        finally:
+            register('date', datetime.date, date_coder.encoder, date_coder.decoder)
+            CODERS.pop(Point, None)
+            DECODERS.pop('_point', None)
+            _dispatch.clear()
+        self.assertNotIn(b"_date", binary.dumps(data["aDate"]))
+        # tags nobody knows decode as they do from JSON
+        self.assertEqual(binary.loads(points), [{"_point": [1, 2]}])
+
+    def test_stream(self):
+        want = [json.loads(json.dumps(x, cls=MultitypeEncoder), cls=MultitypeDecoder) for x in [self.DATA, 1, "x", []]]
+        with tempfile.TemporaryFile() as f:
+            self.assertEqual(binary.dump_iter([self.DATA, 1, "x", []], f), 4)
+            f.seek(0)
+            self.assertEqual(list(binary.load_iter(f)), want)
+            f.seek(0)
+            self.assertEqual(binary.load(f), want[0])
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                values = list(binary.load_iter(m))
+                first = binary.load_iter(m)
+                self.assertEqual(next(first), want[0])
+                first.close()
+            self.assertEqual(values, want)
@@ -0,0 +1,288 @@
+import functools
+import itertools
+import numpy
+from .overwriters import (
+    Overwriter, RuleSet, _OP, _getter, compile_interval, f_between, f_cmp, f_not,
+)
+
+
+"""
+Columnar evaluation of rules over many readables at once.
+
+    trigger_batch(rules, 'pricing', applications)                   # a sequence of objects
+    trigger_batch(rules, 'pricing', {'term': terms, 'tna': tnas})   # a dict of numpy columns
+
+cmp, between and not conditions on numeric columns become numpy masks, and the =, +, -,
+<, > operations are applied to the matching rows of a column at once when numpy gives the
+values and types Python would (ints with ints that stay within int64, floats with floats).
+Anything else (*, that rounds like round(), mixed ints and floats, ints that could overflow,
+other callbacks, text values, |, @ operations) runs with the scalar operations over the matching rows, so every row ends up as if it had
+been triggered on its own.
+"""
+
+NUMERIC = 'biuf'
+
+_VECTOR_CMP = {
+    'lt': numpy.less,
+    'lte': numpy.less_equal,
+    'gt': numpy.greater,
+    'gte': numpy.greater_equal,
+    'eq': numpy.equal,
+    'neq': numpy.not_equal,
+}
+
+_VECTOR_OP = {
+    '=': lambda x, y: numpy.broadcast_to(y, numpy.shape(x)),
+    '+': lambda x, y: x + y,
+    '-': lambda x, y: x - y,
+    '<': lambda x, *y: functools.reduce(numpy.minimum, y, x),
+    '>': lambda x, *y: functools.reduce(numpy.maximum, y, x),
+}
+
+_ARITY = {'=': 1, '+': 1, '-': 1, '*': 1}
+_ROW_OP = ('*',)     # vectorizable, but done with the scalar operation on the masked rows
+
+
+def _is_number(x):
+    return isinstance(x, (int, float))
+
+
+def _array(values):
+    "a numeric column when every value is an int or every value a float, else an object column"
+    if {type(x) for x in values} in ({int}, {float}):
+        column = numpy.array(values)
+        if column.dtype.kind in 'if':      # not ints beyond int64
+            return column
+    column = numpy.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _item(x):
+    return x.item() if isinstance(x, numpy.generic) else x
+
+
+class Columns():
+    "dotted path --> column. Columns of objects are gathered from them on demand"
+
+    def __init__(self, data=None, objects=None):
+        self.objects = objects
+        self.data = {} if data is None else data
+        self.size = len(objects) if objects is not None else len(next(iter(self.data.values()), ()))
+
+    def get(self, path):
+        if path not in self.data:
+            if self.objects is None:
+                return numpy.full(self.size, None, dtype=object)
+            get = _getter(path)
+            self.data[path] = _array([get(x) for x in self.objects])
+        return self.data[path]
+
+    def has(self, attr):
+        if self.objects is None:
+            return attr in self.data
+        return all(hasattr(x, attr) for x in self.objects)
+
+    def put(self, attr, column, mask, values=None):
+        "writes the masked rows of column, or values, the Python values of those rows (on the objects too)"
+        if self.objects is not None:
+            # other attributes may be aliases or properties of this one: gather them again
+            self.data.clear()
+            values = column[mask].tolist() if values is None else values
+            for i, value in zip(numpy.flatnonzero(mask), values):
+                setattr(self.objects[i], attr, value)
+        else:
+            for path in [p for p in self.data if p.startswith(f'{attr}.')]:
+                del self.data[path]
+        self.data[attr] = column
+
+    def set(self, i, attr, value):
+        if self.data[attr].dtype != object:
+            self.data[attr] = self.data[attr].astype(object)
+        self.data[attr][i] = value
+
+    def rows(self):
+        if self.objects is not None:
+            return self.objects
+        return [_Row(self, i) for i in range(self.size)]
+
+    def changed(self):
+        "the objects were written row by row: forget what was gathered"
+        if self.objects is not None:
+            self.data.clear()
+
+
+class _Row():
+    "the i-th row of some Columns as an object ('a.b' columns read as row.a.b)"
+    __slots__ = ('_columns', '_i', '_prefix')
+
+    def __init__(self, columns, i, prefix=''):
+        object.__setattr__(self, '_columns', columns)
+        object.__setattr__(self, '_i', i)
+        object.__setattr__(self, '_prefix', prefix)
+
+    def __getattr__(self, name):
+        path = self._prefix + name
+        data = self._columns.data
+        if path in data:
+            return _item(data[path][self._i])
+        if any(key.startswith(f'{path}.') for key in data):
+            return _Row(self._columns, self._i, f'{path}.')
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self._columns.set(self._i, self._prefix + name, value)
+
+
+def _elementwise(test, column, safe):
+    if not safe:
+        return numpy.array([bool(test(x)) for x in column.tolist()], dtype=bool)
+    mask = numpy.zeros(len(column), dtype=bool)
+    for i, x in enumerate(column.tolist()):
+        try:
+            mask[i] = bool(test(x))
+        except (AttributeError, TypeError):
+            pass
+    return mask
+
+
+def _interval(column, interval, safe):
+    "between(column, interval) for every row"
+    if column.dtype.kind in NUMERIC and isinstance(interval, str):
+        try:
+            if interval.isdigit():
+                return column == int(interval)
+            a, b = interval.split('..')
+            lo = int(a) if a else column
+            hi = int(b) if b else column + 1
+        except ValueError:
+            return numpy.zeros(len(column), dtype=bool)
+        return (lo <= column) & (column < hi)
+    return _elementwise(compile_interval(interval), column, safe)
+
+
+def _keyword(columns, attr, value2):
+    "one keyword of a cmp for every row"
+    s = attr.split('.')
+    if len(s) > 1 and s[-1] in _OP:
+        op = s[-1]
+        column = columns.get(attr.rstrip(f'{op}').strip('.'))
+    else:
+        op = 'eq'
+        column = columns.get(attr)
+    if op == 'btw':
+        return _interval(column, value2, safe=True)
+    if op in _VECTOR_CMP and column.dtype.kind in NUMERIC and _is_number(value2):
+        return _VECTOR_CMP[op](column, value2)
+    cmp = _OP[op]
+    return _elementwise(lambda x: cmp(x, value2), column, safe=True)
+
+
+def _condition(columns, what, args, kwargs):
+    "the condition what(x, *args, **kwargs) for every row"
+    callback = Overwriter.CALLBACKS.get(what)
+    if callback is f_cmp and not args:
+        mask = numpy.ones(columns.size, dtype=bool)
+        for attr, value2 in kwargs.items():
+            mask &= _keyword(columns, attr, value2)
+        return mask
+    if callback is f_between and len(args) == 2 and not kwargs and isinstance(args[0], str):
+        return _interval(columns.get(args[0]), args[1], safe=False)
+    if callback is f_not and args:
+        return ~_condition(columns, args[0], args[1:], kwargs)
+    return numpy.array([bool(Overwriter.CALLBACKS[what](x, *args, **kwargs)) for x in columns.rows()], dtype=bool)
+
+
+def _operand(x, readables, writables, old):
+    "a numeric column or number for baseline(x), or None if it has to be done row by row"
+    if isinstance(x, str) and x.startswith('$'):
+        if x == '$x':
+            return old
+        for name, columns in [('b', readables), ('w', writables)]:
+            if x.startswith(f'${name}.'):
+                column = columns.get(x.strip(f'${name}.'))
+                return column if column.dtype.kind in NUMERIC else None
+        return None
+    return x if _is_number(x) else None
+
+
+def _kind(x):
+    "'i' or 'f' for int and float columns or numbers, else None"
+    if isinstance(x, numpy.ndarray):
+        return x.dtype.kind if x.dtype.kind in 'if' else None
+    return {int: 'i', float: 'f'}.get(type(x))
+
+
+def _fits(op, old, operands):
+    "False if an int + or - could leave int64 on some row, where Python ints would not wrap"
+    if op not in ('+', '-') or _kind(old) != 'i':
+        return True
+    (lo, hi), (a, b) = [(int(x.min()), int(x.max())) if isinstance(x, numpy.ndarray) else (x, x)
+                        for x in [old, operands[0]]]
+    lo, hi = (lo + a, hi + b) if op == '+' else (lo - b, hi - a)
+    bounds = numpy.iinfo(numpy.int64)
+    return bounds.min <= lo and hi <= bounds.max
+
+
+def _by_rows(op, old, operands):
+    "the scalar operation on each (masked) row, as Python values"
+    operation = Overwriter.OP[op]
+    operands = [x.tolist() if isinstance(x, numpy.ndarray) else itertools.repeat(x) for x in operands]
+    return [operation(x, *y) for x, *y in zip(old.tolist(), *operands)]
+
+
+def _apply(w, mask, readables, writables):
+    "applies the operations of w to the masked rows. True if it had to be done row by row"
+    by_row = False
+    for op, values in w.ops.items():
+        for attr, value in values.items():
+            old = writables.get(attr) if writables.has(attr) else None
+            operands = None
+            if ((op in _VECTOR_OP or op in _ROW_OP) and old is not None and old.dtype.kind in 'iuf' and
+                    len(value) == _ARITY.get(op, max(len(value), 1))):
+                operands = [_operand(x, readables, writables, old) for x in value]
+            if operands is not None and all(x is not None for x in operands):
+                operands = [x[mask] if isinstance(x, numpy.ndarray) else x for x in operands]
+                kinds = {_kind(x) for x in [old, *operands]}
+                if op in _VECTOR_OP and len(kinds) == 1 and None not in kinds and _fits(op, old[mask], operands):
+                    new, rows = numpy.asarray(_VECTOR_OP[op](old[mask], *operands)), None
+                else:
+                    rows = _by_rows(op, old[mask], operands)
+                    new = _array(rows)
+                column = old.astype(numpy.result_type(old, new))
+                column[mask] = new
+                writables.put(attr, column, mask, rows)
+                continue
+            bases, targets = readables.rows(), writables.rows()
+            for i in numpy.flatnonzero(mask):
+                w.write(op, attr, value, [targets[i]], bases[i])
+            by_row = True
+    return by_row
+
+
+def trigger_batch(rules, event='', readables=(), writables=None):
+    """Overwriter.trigger(rules, event, readable, writables) for many readables at once.
+    rules: a rule text or a RuleSet
+    readables: a sequence of objects, or a dict of columns (dotted paths as keys)
+    writables: for dict readables, a dict of columns to write to (the readables by default).
+        For a sequence, each object is its own writable; use Overwriter.trigger to pass others.
+    returns the response of each row. Dict columns are replaced by their new values."""
+    rules = rules if isinstance(rules, RuleSet) else Overwriter.compile(rules)
+    if isinstance(readables, dict):
+        readables = Columns(readables)
+        writables = readables if writables is None else Columns(writables)
+    else:
+        if writables is not None:
+            raise ValueError('writables are only supported with dict readables')
+        readables = writables = Columns(objects=list(readables))
+
+    responses = [[] for _ in range(readables.size)]
+    for w in rules.events.get(event, ()):
+        mask = _condition(readables, w.what, w.args, w.kwargs)
+        if not mask.any():
+            continue
+        if _apply(w, mask, readables, writables):
+            readables.changed()
+        for i in numpy.flatnonzero(mask):
+            responses[i].append(str(w))
+    return responses
@@ -0,0 +1,65 @@
+import copy
+import functools
+from collections import OrderedDict
+from threading import Lock
+
+
+class QuoteCache():
+    """Bounded LRU cache for Product quotes.
+    e.g.: Product.cache = QuoteCache(4096)  # or on a single product
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, compute, *args, **kwargs):
+        "returns the cached value for key, or stores compute(*args, **kwargs)"
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        value = compute(*args, **kwargs)
+        with self._lock:
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+def cached(method):
+    """memoizes a method in `self.cache` (when it's set), keyed on `self.fingerprint()`.
+    Any change to the object (e.g. an Overwriter rule on its expenses) changes the key."""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.cache is None:
+            return method(self, *args, **kwargs)
+        key = (name, self.fingerprint(), args, tuple(sorted(kwargs.items())))
+        return copy.copy(self.cache.get(key, method, self, *args, **kwargs))
+    return wrapper
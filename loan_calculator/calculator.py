@@ -1,6 +1,10 @@
 import numpy
 from collections import namedtuple
-from .overwriters import alias, setargs
+from operator import attrgetter
+from .cache import cached
+from .irr import annual_rate, annuity_irr, irr
+from .overwriters import setargs
+from .plan import Installment, RepaymentPlan
 
 
 """
@@ -21,9 +25,32 @@ Magic maths
 """
 
 
-Installment = namedtuple('Installment',
-    'month, amount, interest, capital, life, fire, serv, remaining_capital, ' +
-    'itax, ftax, stax, tax')
+Aggregate = namedtuple('Aggregate',
+    'first_payment, last_payment, avg_payment, total_amount, total_interest, total_insurance, total_tax')
+
+Coefficients = namedtuple('Coefficients', 'otax, ntax, etax, fixed')
+
+
+def _alias(name):
+    "a read/write property for another attribute"
+    return property(attrgetter(name), lambda self, value: setattr(self, name, value))
+
+
+def annuity_factor(t, n):
+    "present value of n unit payments at a monthly rate t (the magic number)"
+    return (1 - (1 / (1 + t)) ** n) / t
+
+
+def _columns(months, rk, ix, kx, exp, p):
+    "Installment columns given the remaining capital, interest and capital of each month"
+    life = rk * exp.life                    # life insurance
+    fire = rk * exp.fire + exp.sivr * p     # fire insurance
+    itax = ix * exp.itax
+    ftax = fire * exp.etax
+    stax = exp.serv * exp.etax
+    tax = itax + ftax + stax
+    amount = kx + ix + life + fire + exp.serv + tax
+    return months, amount, ix, kx, life, fire, exp.serv, rk - kx, itax, ftax, stax, tax
 
 
 class FrenchCalculator():
@@ -32,7 +59,7 @@ class FrenchCalculator():
     def first_payment(self, k, n, tna, exp, p):
         "returns the first payment in french amortization"
         t = tna / 12
-        z = (1 - (1 / (1 + t)) ** n) / t                        # magic number
+        z = annuity_factor(t, n)                                # magic number
         base = k / z
         ix = k * t                                              # interest this payment
         kx = base - ix                                          # capital this payment
@@ -42,38 +69,63 @@ class FrenchCalculator():
         payment = kx + ix + lifex + firex + exp.serv + tax      # total payment amount
         return payment
 
+    def principal(self, k, n, t, months):
+        "remaining capital (before paying), interest and capital of the given months"
+        base = k / annuity_factor(t, n)     # base payment
+        q = (1 + t) ** (months - 1)
+        rk = k * q - base * (q - 1) / t     # closed form of rk = rk * (1 + t) - base
+        ix = rk * t
+        return rk, ix, base - ix
+
+    def totals(self, k, n, t):
+        "sum of the remaining capitals (before paying) and total interest"
+        interest = n * k / annuity_factor(t, n) - k
+        return interest / t, interest
+
+    def aggregates(self, k, n, tna, exp, p):
+        "plan totals in closed form, without building the plan"
+        t = tna / 12
+        srk, interest = self.totals(k, n, t)
+        fire = srk * exp.fire + n * exp.sivr * p
+        insurance = srk * exp.life + fire
+        tax = interest * exp.itax + (fire + n * exp.serv) * exp.etax
+        total = k + interest + insurance + n * exp.serv + tax
+        first = self.first_payment(k, n, tna, exp, p)     # the installment, without a final capital
+        last = _columns(n, *self.principal(k, n, t, n), exp, p)[1]
+        return Aggregate(first, last, total / n, total, interest, insurance, tax)
+
+    def repayment_table(self, k, n, tna, exp, p, months=None):
+        "calculates the payment plan as a columnar RepaymentPlan"
+        t = tna / 12
+        months = numpy.arange(1, n + 1) if months is None else months
+        rk, ix, kx = self.principal(k, n, t, months)
+        plan = RepaymentPlan.empty(len(months))
+        for i, column in enumerate(_columns(months, rk, ix, kx, exp, p)):
+            plan.data[i] = column
+        return plan
+
     def repayment_plan(self, k, n, tna, exp, p):
         "calculates the payment plan for french depreciation"
+        return self.repayment_table(k, n, tna, exp, p).installments()
+
+    def iter_repayment_plan(self, k, n, tna, exp, p, start=1, chunk=12):
+        """yields the Installments from month `start` on, computing `chunk` months at a time.
+        Every month is in closed form, so starting late costs nothing."""
+        if start < 1:
+            raise ValueError(f'months start at 1, not {start}')
+        for month in range(start, n + 1, chunk):
+            months = numpy.arange(month, min(month + chunk, n + 1))
+            yield from self.repayment_table(k, n, tna, exp, p, months).installments()
+
+    def cashflows(self, k, n, tna, exp, p):
+        "(a, b, r, c) such that the installment of month j is a + b * r**(j-1) + c * (j == n)"
         t = tna / 12
-        z = (1 - (1 / (1 + t)) ** n) / t    # magic number
-        base = k / z                        # base payment
-
-        installments = []
-        rk = k                              # remaining capital
-        for j in range(1, n + 1):
-            ii = rk * t                             # interest this payment
-            ki = base - ii                          # capital this payment
-            life = rk * exp.life                    # life insurance this payment
-            fire = rk * exp.fire + exp.sivr * p     # fire insurance this payment
-            tax = ii * exp.itax + (fire + exp.serv) * exp.etax
-            rk = rk - ki                            # remainint capital
-            installment = Installment(
-                month=j,
-                amount=ki + ii + life + fire + exp.serv + tax,
-                interest=ii,
-                capital=ki,
-                life=life,
-                fire=fire,
-                serv=exp.serv,
-                remaining_capital=rk,
-                itax=ii * exp.itax,
-                ftax=fire * exp.etax,
-                stax=exp.serv * exp.etax,
-                tax=tax,
-            )
-            installments.append(installment)
-        assert round(rk, 1) == 0
-        return installments
+        z = annuity_factor(t, n)
+        etax = exp.coefficients.etax
+        g = (p * exp.sivr + exp.serv) * etax                # additive expenses
+        h = exp.life + exp.fire * etax + t * exp.itax       # coeficient of expenses
+        # remaining capital of month j: k / (t z) + k (1 - 1 / (t z)) (1 + t)**(j-1)
+        return k / z + g + h * k / (t * z), h * k * (1 - 1 / (t * z)), 1 + t, 0.0
 
     def max_capital(self, c, n, tna, exp, p, ltv=None):
         """ (p1 --> K) maximize the capital given a monthly payment amount
@@ -81,16 +133,16 @@ class FrenchCalculator():
         p: collateral value
         """
         t = tna / 12
-        etax = exp.etax + 1
+        etax = exp.coefficients.etax
         if p is not None:
             g = p * exp.sivr * etax + exp.serv * etax       # additive expenses
             h = exp.life + exp.fire * etax + t * exp.itax   # coeficient of expenses
-            z = (1 - (1 / (1 + t)) ** n) / t                # mmmm... its magic
+            z = annuity_factor(t, n)                        # mmmm... its magic
             k = z * (c - g) / (1 + z * h)                   # max capital
         else:
             g = exp.serv * etax
             h = exp.life + exp.fire * etax + (exp.sivr * etax / ltv) + t * exp.itax
-            z = (1 - (1 / (1 + t)) ** n) / t
+            z = annuity_factor(t, n)
             k = z * (c - g) / (1 + z * h)
         return k
 
@@ -102,30 +154,56 @@ class FrenchCalculator():
     def revert_capital(self, Kd, exp):
         "(Kd --> K) given a disbursable capital, return the total capital"
         ax, Ax, bx, Bx = exp.a, exp.A, exp.b, exp.B
-        if exp.a:
-            Kx = exp.A / exp.a
+        if ax:
+            Kx = Ax / ax
             Kdx = self.disbursable_capital(Kx, exp)
             if Kd <= Kdx:
                 ax = 0
             else:
                 Ax = 0
-        if exp.b:
-            Kx = exp.B / exp.b
+        if bx:
+            Kx = Bx / bx
             Kdx = self.disbursable_capital(Kx, exp)
             if Kd <= Kdx:
                 bx = 0
             else:
                 Bx = 0
 
-        otax = exp.otax + 1
-        ntax = exp.ntax + 1
-        K = (Kd + Ax * otax + Bx * ntax + exp.Fa * otax + exp.Fb * ntax) / (1 - ax * otax - bx * ntax)
+        otax, ntax, _, fixed = exp.coefficients
+        K = (Kd + Ax * otax + Bx * ntax + fixed) / (1 - ax * otax - bx * ntax)
         return K
 
+    def revert_breakpoints(self, exp):
+        """the disbursable capitals where origination and notary switch from their minimum to their
+        rate (sorted), and the (numerator, denominator) of K = (Kd + num) / den in each regime.
+        Cached on exp until it changes"""
+        return exp.derived(('breakpoints', self.code), self._revert_breakpoints, exp)
+
+    def _revert_breakpoints(self, exp):
+        points = sorted((self.disbursable_capital(m / pct, exp), name)
+                        for name, pct, m in [('a', exp.a, exp.A), ('b', exp.b, exp.B)] if pct)
+        otax, ntax, _, fixed = exp.coefficients
+        num, den = [], []
+        for r in range(len(points) + 1):
+            above = [name for _, name in points[:r]]     # these use their rate, the others their minimum
+            ax, Ax = (exp.a, 0) if 'a' in above else (0, exp.A)
+            bx, Bx = (exp.b, 0) if 'b' in above else (0, exp.B)
+            num.append(Ax * otax + Bx * ntax + fixed)
+            den.append(1 - ax * otax - bx * ntax)
+        arrays = numpy.array([x for x, _ in points]), numpy.array(num), numpy.array(den)
+        for x in arrays:
+            x.flags.writeable = False   # shared by every call until exp changes
+        return arrays
+
+    def revert_capitals(self, Kd, exp):
+        "(Kd --> K) revert_capital() over an array of disbursable capitals"
+        breakpoints, num, den = self.revert_breakpoints(exp)
+        r = numpy.searchsorted(breakpoints, Kd)     # how many breakpoints are below each Kd
+        return (Kd + num[r]) / den[r]
+
     def expenses(self, K, exp):
-        otax = exp.otax + 1
-        ntax = exp.ntax + 1
-        return max(K * exp.a, exp.A) * otax + max(K * exp.b, exp.B) * ntax + exp.Fa * otax + exp.Fb * ntax
+        otax, ntax, _, fixed = exp.coefficients
+        return numpy.maximum(K * exp.a, exp.A) * otax + numpy.maximum(K * exp.b, exp.B) * ntax + fixed
 
 
 class AmericanCalculator(FrenchCalculator):
@@ -140,55 +218,44 @@ class AmericanCalculator(FrenchCalculator):
         tax = (firex + exp.serv) * exp.etax + ix * exp.itax
         return ix + lifex + firex + exp.serv + tax
 
-    def repayment_plan(self, k, n, tna, exp, p):
-        "calculates the payment plan for american depreciation"
-        installments = []
+    def principal(self, k, n, t, months):
+        "remaining capital (before paying), interest and capital of the given months"
+        rk = numpy.zeros(numpy.shape(months)) + k
+        return rk, rk * t, numpy.where(months == n, rk, 0.0)
+
+    def totals(self, k, n, t):
+        "sum of the remaining capitals (before paying) and total interest"
+        return n * k, n * k * t
+
+    def aggregates(self, k, n, tna, exp, p):
+        "plan totals in closed form. The last installment is only capital and interest"
+        agg = super().aggregates(k, n, tna, exp, p)
+        last = k + k * tna / 12
+        total = agg.total_amount - agg.last_payment + last
+        return agg._replace(last_payment=last, avg_payment=total / n, total_amount=total)
+
+    def repayment_table(self, k, n, tna, exp, p, months=None):
+        "calculates the payment plan as a columnar RepaymentPlan"
+        plan = super().repayment_table(k, n, tna, exp, p, months)
+        last = plan.month == n
+        plan.amount[last] = plan.capital[last] + plan.interest[last]
+        plan.itax[last] = plan.interest[last] * plan.tax[last]
+        return plan
+
+    def cashflows(self, k, n, tna, exp, p):
+        "(a, b, r, c) such that the installment of month j is a + b * r**(j-1) + c * (j == n)"
         t = tna / 12
-        ix = k * t
-        lifex = k * exp.life
-        firex = k * exp.fire + exp.sivr * p
-        tax = (firex + exp.serv) * exp.etax + ix * exp.itax
-        amount = ix + tax + lifex + firex + exp.serv
-        for i in range(1, n):
-            installment = Installment(
-                month=i,
-                amount=amount,
-                interest=ix,
-                capital=0.0,
-                life=lifex,
-                fire=firex,
-                serv=exp.serv,
-                remaining_capital=k,
-                itax=ix * exp.itax,
-                ftax=firex * exp.etax,
-                stax=exp.serv * exp.etax,
-                tax=tax,
-            )
-            installments.append(installment)
-
-        installment = Installment(
-            month=n,
-            amount=k+ix,
-            interest=ix,
-            capital=k,
-            life=lifex,
-            fire=firex,
-            serv=exp.serv,
-            remaining_capital=0.0,
-            itax=ix * tax,
-            ftax=firex * exp.etax,
-            stax=exp.serv * exp.etax,
-            tax=tax,
-        )
-        installments.append(installment)
-        return installments
+        etax = exp.coefficients.etax
+        g = (p * exp.sivr + exp.serv) * etax
+        h = exp.life + exp.fire * etax + t * exp.itax
+        return k * (t + h) + g, 0.0, 1.0, k - k * h - g
 
     def max_capital(self, c, n, tna, exp, p, ltv=None):
         """ (p1 --> K) maximize the capital given a monthly payment amount (american depreciation)
         c: maximum monthly payment
         """
         t = tna / 12
-        etax = exp.etax + 1
+        etax = exp.coefficients.etax
         g = p * exp.sivr * etax + exp.serv * etax   # additive expenses
         h = exp.life + exp.fire * exp.etax + t * exp.itax    # coeficient of expenses
         k = (c - g) / (t + h)
@@ -198,9 +265,16 @@ class AmericanCalculator(FrenchCalculator):
 ####### LOAN SIMULATION ###############
 
 class Expense():
+    """Expenses of a product.
+    Derived coefficients (coefficients, fingerprint(), derived()) are cached until any attribute changes."""
     TAX = 0.21
+    FIELDS = ('origination_pct', 'origination_min', 'origination_fixed', 'otax',
+              'notary_pct', 'notary_min', 'notary_fixed', 'ntax',
+              'life', 'fire', 'sivr', 'serv', 'itax', 'etax')
+    __slots__ = FIELDS + ('_derived',)
 
     def __init__(self, **args):
+        object.__setattr__(self, '_derived', {})
         # over capital
         self.origination_pct = 0
         self.origination_min = 0
@@ -219,18 +293,58 @@ class Expense():
         self.itax = self.TAX    # over interest
         self.etax = self.TAX    # over ensurance and servicing
 
-        setargs(self, **args)
+        for name, value in args.items():
+            try:
+                setargs(self, **{name: value})
+            except AttributeError:
+                pass            # not an expense, setargs warned about it
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        self._derived.clear()
 
-    a = alias('origination_pct')
-    A = alias('origination_min')
-    Fa = alias('origination_fixed')
-    b = alias('notary_pct')
-    B = alias('notary_min')
-    Fb = alias('notary_fixed')
+    def __getstate__(self):
+        return self.fingerprint()
+
+    def __setstate__(self, state):
+        object.__setattr__(self, '_derived', {})
+        for name, value in state:
+            object.__setattr__(self, name, value)
+
+    def derived(self, key, compute, *args):
+        "compute(*args), cached under key until the expenses change"
+        try:
+            return self._derived[key]
+        except KeyError:
+            value = self._derived[key] = compute(*args)
+            return value
+
+    @property
+    def coefficients(self):
+        "(otax + 1, ntax + 1, etax + 1, fixed origination and notary with their taxes)"
+        try:
+            return self._derived['coefficients']
+        except KeyError:
+            otax, ntax = self.otax + 1, self.ntax + 1
+            value = self._derived['coefficients'] = Coefficients(
+                otax, ntax, self.etax + 1, self.origination_fixed * otax + self.notary_fixed * ntax)
+            return value
+
+    def fingerprint(self):
+        "hashable snapshot of the expenses"
+        return self.derived('fingerprint', lambda: tuple((x, getattr(self, x)) for x in self.FIELDS))
+
+    a = _alias('origination_pct')
+    A = _alias('origination_min')
+    Fa = _alias('origination_fixed')
+    b = _alias('notary_pct')
+    B = _alias('notary_min')
+    Fb = _alias('notary_fixed')
 
 
 class Product():
     CALCULATORS = {x.code: x() for x in [FrenchCalculator, AmericanCalculator]}
+    cache = None    # a QuoteCache, to memoize quotes
 
     def __init__(self, tna=0, collateral=0, depreciation='FR', **args):
         self.tna = tna
@@ -238,18 +352,30 @@ class Product():
         self.expenses = Expense(**args)
         self.depreciation = depreciation
 
-    exp = alias('expenses')
+    exp = _alias('expenses')
 
     @property
     def calculator(self):
         return self.CALCULATORS[self.depreciation]
 
+    def fingerprint(self):
+        "hashable snapshot of everything a quote depends on"
+        return (self.depreciation, self.tna, self.collateral, self.exp.fingerprint())
+
+    @cached
     def first_payment(self, k, n):
         return self.calculator.first_payment(k, n, self.tna, self.exp, self.collateral)
 
-    def repayment_plan(self, k, n):
+    def repayment_plan(self, k, n, table=False):
+        "list of Installments, or a columnar RepaymentPlan if table=True"
+        if table:
+            return self.calculator.repayment_table(k, n, self.tna, self.exp, self.collateral)
         return self.calculator.repayment_plan(k, n, self.tna, self.exp, self.collateral)
 
+    def iter_repayment_plan(self, k, n, start=1):
+        return self.calculator.iter_repayment_plan(k, n, self.tna, self.exp, self.collateral, start)
+
+    @cached
     def max_capital(self, c, n, ltv=None):
         return self.calculator.max_capital(c, n, self.tna, self.exp, self.collateral, ltv)
 
@@ -259,25 +385,40 @@ class Product():
     def revert_capital(self, kd):
         return self.calculator.revert_capital(kd, self.exp)
 
+    def revert_capitals(self, kds):
+        return self.calculator.revert_capitals(numpy.asarray(kds, dtype=numpy.float64), self.exp)
+
     def total_expenses(self, k):
         return self.calculator.expenses(k, self.exp)
 
+    def aggregates(self, k, n):
+        return self.calculator.aggregates(k, n, self.tna, self.exp, self.collateral)
+
     def avg_payment(self, k=0, n=1, plan=None):
-        plan = plan or self.repayment_plan(k, n)
-        return round(sum(x.amount for x in plan) / len(plan), 3)
+        if plan is None:
+            return round(float(self.aggregates(k, n).avg_payment), 3)
+        return round(float(RepaymentPlan.of(plan).amount.mean()), 3)
 
-    def cft(self, k=0, n=1, kd=None, plan=None):
-        plan = plan or self.repayment_plan(k, n)
+    def cashflows(self, k, n):
+        return self.calculator.cashflows(k, n, self.tna, self.exp, self.collateral)
+
+    def cft(self, k=0, n=1, kd=None, plan=None, guess=None):
+        """annual effective cost of the loan.
+        guess: a nearby cft to start the solver from (warm start)"""
         kd = kd or self.disbursable_capital(k)
-        payments = [-x.amount for x in plan]
-        aux = numpy.irr([kd] + payments)
-        cft = ((1 + aux) ** 12) - 1
+        guess = None if guess is None else (1 + guess) ** (1 / 12) - 1
+        if plan is None:
+            aux = annuity_irr(kd, *self.cashflows(k, n), n=n, guess=guess)
+        else:
+            aux = irr(numpy.concatenate(([kd], -RepaymentPlan.of(plan).amount)), guess)[0]
+        cft = float(annual_rate(aux))
         cft = cft or 0.0
         return round(cft, 3)
 
+    @cached
     def calculate(self, k, n):
         exp = self.expenses
-        plan = self.repayment_plan(k, n)
+        agg = self.aggregates(k, n)
         ori = max(exp.origination_min, k * exp.origination_pct) + exp.origination_fixed
         nota = max(exp.notary_min, k * exp.notary_pct) + exp.notary_fixed
         kd = self.disbursable_capital(k)
@@ -285,9 +426,34 @@ class Product():
             term=n,
             disbursable=kd,
             capital=k,
-            first_payment=self.first_payment(k, n),
-            avg_payment=self.avg_payment(plan=plan),
-            cft=self.cft(kd=kd, plan=plan),
+            first_payment=float(agg.first_payment),
+            avg_payment=round(float(agg.avg_payment), 3),
+            cft=self.cft(k, n, kd=kd),
+            origination=ori,
+            otax=ori * exp.otax,
+            notary=nota,
+            ntax=nota * exp.ntax,
+        )
+
+    def calculate_grid(self, ks, ns):
+        """calculate() for every (term, capital) pair in one pass.
+        returns a Result whose fields are arrays of shape (len(ns), len(ks))"""
+        exp = self.expenses
+        ks = numpy.asarray(ks, dtype=numpy.float64)
+        capital, term = numpy.meshgrid(ks, numpy.asarray(ns, dtype=int))
+        kd = self.disbursable_capital(ks)
+        agg = self.aggregates(capital, term)
+        rate = annuity_irr(kd, *self.cashflows(capital, term), n=term)
+        cft = numpy.round(annual_rate(rate), 3)
+        ori = numpy.maximum(exp.origination_min, capital * exp.origination_pct) + exp.origination_fixed
+        nota = numpy.maximum(exp.notary_min, capital * exp.notary_pct) + exp.notary_fixed
+        return Result(
+            term=term,
+            disbursable=numpy.broadcast_to(kd, capital.shape).copy(),
+            capital=capital,
+            first_payment=agg.first_payment,
+            avg_payment=numpy.round(agg.avg_payment, 3),
+            cft=cft,
             origination=ori,
             otax=ori * exp.otax,
             notary=nota,
@@ -298,6 +464,31 @@ class Product():
         k = self.revert_capital(kd)
         return self.calculate(k, n)
 
+    def best_offers(self, c, ns, ltv=None, top=None):
+        """the largest loans that can be afforded with a monthly payment c (e.g. income * max ratio)
+        over the terms ns, capped at ltv * collateral. Terms that don't give more capital than a
+        shorter one are dropped. Returns the Results, largest capital first."""
+        ns = numpy.sort(numpy.asarray(ns, dtype=int))
+        ks = self.calculator.max_capital(c, ns, self.tna, self.exp, self.collateral, ltv)
+        ks = numpy.broadcast_to(ks, ns.shape)
+        if ltv and self.collateral:
+            ks = numpy.minimum(ks, ltv * self.collateral)
+        best = numpy.maximum.accumulate(ks)
+        keep = (ks > 0) & (ks > numpy.concatenate(([-numpy.inf], best[:-1])))     # not dominated
+        order = numpy.argsort(-ks[keep], kind='stable')[:top]
+        return [self.calculate(float(k), int(n)) for k, n in zip(ks[keep][order], ns[keep][order])]
+
+    def calculate_grid_from_disbursable(self, kds, ns):
+        "calculate_from_disbursable() for every (term, disbursable capital) pair, like calculate_grid()"
+        return self.calculate_grid(self.revert_capitals(kds), ns)
+
+
+def best_offers(products, c, ns, ltv=None, top=None):
+    "Product.best_offers() across many products: a list of (product, Result), largest capital first"
+    offers = [(p, r) for p in products for r in p.best_offers(c, ns, ltv, top)]
+    offers.sort(key=lambda x: (-x[1].capital, x[1].term, x[1].cft))
+    return offers[:top]
+
 
 class Result():
     def __init__(self, **args):
@@ -0,0 +1,90 @@
+import asyncio
+import bisect
+import copy
+import functools
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, wait
+from .irr import annual_rate
+from .overwriters import Overwriter
+from .portfolio import _SerialExecutor
+
+
+"""
+Quotes of one applicant across many products, ranked by CFT.
+
+    compare(products, applicant, 60, k=1e6, rules=RULES, event='pricing', top=3)
+
+The rules of the event are triggered on a copy of each product (and of its expenses),
+with the applicant as readable, so shared products are never modified.
+Expenses never lower the CFT below the bare rate, so with `top` the products are quoted
+by increasing rate and the ones that can't beat the top offers so far are skipped.
+"""
+
+
+def prepare(product, applicant=None, rules=None, event=''):
+    "a copy of product with the rules of event triggered on it for the applicant"
+    p = copy.copy(product)
+    p.expenses = copy.copy(product.expenses)
+    if rules:
+        Overwriter.trigger(rules, event, applicant, [p, p.expenses])
+    return p
+
+
+def quote(product, n, k=None, kd=None):
+    "calculate(k, n), or calculate_from_disbursable(kd, n) when kd is given"
+    if kd is None:
+        return product.calculate(k, n)
+    return product.calculate_from_disbursable(kd, n)
+
+
+def min_cft(product):
+    "a lower bound of the CFT of any loan of product: the annual rate of its tna"
+    return round(float(annual_rate(product.tna / 12)), 3)
+
+
+def _cft(result):
+    return result.cft if result.cft == result.cft else math.inf     # nan last
+
+
+def compare(products, applicant=None, n=12, k=None, kd=None, rules=None, event='', top=None,
+            executor=None, inflight=None):
+    """quote() of every product for the applicant, after its rules.
+    Returns [(product copy, Result)], lowest CFT first, at most top of them.
+    executor: a thread or process pool to run on (this thread by default). Process pools need
+        picklable products and applicant (no QuoteCache on the instances) and rules as text.
+    inflight: quotes submitted at a time (2 per CPU by default), the granularity of the cut-off."""
+    executor = executor or _SerialExecutor()
+    inflight = inflight or 2 * (os.cpu_count() or 1)
+    futures = [executor.submit(prepare, p, applicant, rules, event) for p in products]
+    prepared = sorted((f.result() for f in futures), key=min_cft)
+
+    offers = []         # sorted (cft, order, product, result)
+    pending = {}
+
+    def collect(done):
+        for future in done:
+            i, p = pending.pop(future)
+            result = future.result()
+            bisect.insort(offers, (_cft(result), i, p, result), key=lambda x: x[:2])
+
+    for i, p in enumerate(prepared):
+        if top and len(offers) >= top and min_cft(p) > offers[top - 1][0]:
+            break                   # neither this nor the next ones can make it
+        if len(pending) >= inflight:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+            if top and len(offers) >= top and min_cft(p) > offers[top - 1][0]:
+                break
+        pending[executor.submit(quote, p, n, k, kd)] = (i, p)
+        collect([f for f in pending if f.done()])
+    collect(wait(pending).done)
+    return [(p, result) for _, _, p, result in offers[:top]]
+
+
+async def acompare(products, applicant=None, n=12, k=None, kd=None, rules=None, event='', top=None,
+                   executor=None, inflight=None):
+    "compare() without blocking the event loop"
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(
+        compare, products, applicant, n, k, kd, rules, event, top, executor, inflight))
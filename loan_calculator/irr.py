@@ -0,0 +1,156 @@
+import math
+import numpy
+
+
+"""
+Monthly rates of return of a loan: the disbursed capital at month 0 against the
+installments at months 1..n.
+
+    npv(i) = kd - sum(amount_j / (1 + i) ** j)
+
+Rates are solved with Newton steps kept inside a bracket (bisection when a step
+leaves it). The derivative comes from a complex step, npv(i + ih) = npv(i) + ih npv'(i),
+which is exact and has no cancellation, so the closed forms below need no special
+case when a ratio gets close to 1.
+
+Annuity shaped cash flows (what the calculators produce) are
+    amount_j = a + b * r ** (j - 1) + c * (j == n)
+and their npv is evaluated in O(1), no matter the term. A single loan is solved with
+plain floats instead (an exact npv and its derivative), and its bracket is only probed
+when a Newton step leaves it.
+"""
+
+H = 1e-20               # complex step
+LO, HI = -0.5, 1.0      # initial bracket of monthly rates
+
+
+def _sum_powers(log_x, n):
+    "x + x**2 + ... + x**n, given log(x)"
+    return numpy.exp(log_x) * numpy.expm1(n * log_x) / numpy.expm1(log_x)
+
+
+def _powers(log_x, n):
+    "x + x**2 + ... + x**n and x + 2 x**2 + ... + n x**n, given log(x), for one float"
+    if abs(log_x) < 1e-8:               # the second one cancels: its Taylor expansion is enough
+        s = n if log_x == 0 else math.exp(log_x) * math.expm1(n * log_x) / math.expm1(log_x)
+        return s, n * (n + 1) / 2 + log_x * n * (n + 1) * (2 * n + 1) / 6
+    x, e, m = math.exp(log_x), math.expm1(log_x), math.expm1(n * log_x)
+    s = x * m / e
+    return s, s + x * (n * (m + 1) * e - m * x) / (e * e)
+
+
+def _solve_scalar(npv, guess=None, tol=1e-12, maxiter=100):
+    """solve() for one rate, where npv(i) gives npv and its derivative as floats.
+    The bracket is assumed until a step leaves it, and only then probed (and widened)."""
+    lo, hi, probed = LO, HI, False
+    if guess is None:
+        f, df = npv(0.0)
+        guess = -f / df if df > 0 else math.nan
+    i = float(guess)
+    for _ in range(maxiter):
+        if not lo < i < hi:
+            if not probed:
+                for _ in range(8):              # widen the bracket for expensive loans
+                    if not npv(hi)[0] < 0:
+                        break
+                    lo, hi = hi, hi * 4
+                if not (npv(LO)[0] < 0 < npv(hi)[0]):
+                    return math.nan
+                probed = True
+            i = (lo + hi) / 2
+        f, df = npv(i)
+        if f == 0:
+            return i
+        if f < 0:
+            lo = i
+        else:
+            hi = i
+        x = i - f / df if df > 0 else math.nan
+        if abs(x - i) <= tol * max(1, abs(x)):
+            return x
+        i = x                                   # bisects on the next round if it left the bracket
+    return (lo + hi) / 2 if math.isnan(i) else i
+
+
+def solve(npv, guess=None, tol=1e-12, maxiter=100):
+    """rates where npv(i) == 0, for an increasing npv that accepts (complex) arrays.
+    guess: starting rates, e.g. a previous result (warm start).
+    By default it starts from the duration estimate -npv(0) / npv'(0)."""
+    with numpy.errstate(all='ignore'):          # overflows only happen far from the root
+        y = npv(numpy.zeros(()) + H * 1j)
+        shape = numpy.shape(y)
+        lo = numpy.full(shape, LO)
+        hi = numpy.full(shape, HI)
+        for _ in range(8):                      # widen the bracket for expensive loans
+            low = npv(hi + 0j).real < 0
+            if not low.any():
+                break
+            hi = numpy.where(low, hi * 4, hi)
+        valid = (npv(lo + 0j).real < 0) & (npv(hi + 0j).real > 0)
+
+        if guess is None:
+            guess = -y.real / (y.imag / H)
+        i = numpy.broadcast_to(numpy.asarray(guess, dtype=numpy.float64), shape).copy()
+        i = numpy.where((i > lo) & (i < hi), i, (lo + hi) / 2)
+        for _ in range(maxiter):
+            y = npv(i + H * 1j)
+            f, df = y.real, y.imag / H
+            lo = numpy.where(f < 0, i, lo)
+            hi = numpy.where(f > 0, i, hi)
+            x = numpy.where(f == 0, i, i - f / df)
+            x = numpy.where((f == 0) | ((x > lo) & (x < hi)), x, (lo + hi) / 2)
+            done = numpy.abs(x - i) <= tol * numpy.maximum(1, numpy.abs(x))
+            i = x
+            if done.all():
+                break
+    return numpy.where(valid, i, numpy.nan)
+
+
+def irr(flows, guess=None, tol=1e-12, maxiter=100):
+    """monthly internal rate of return of each row of cash flows [kd, -amount_1, ..., -amount_n]
+    (the same convention as the old numpy.irr)"""
+    flows = numpy.atleast_2d(numpy.asarray(flows, dtype=numpy.float64))
+    j = numpy.arange(flows.shape[1])
+
+    def npv(i):
+        return (flows * (1 + i)[..., None] ** -j).sum(axis=-1)
+
+    return solve(npv, guess, tol, maxiter)
+
+
+def annuity_irr(kd, a, b=0.0, r=1.0, c=0.0, n=1, guess=None, tol=1e-12, maxiter=100):
+    """monthly internal rate of return of kd against amount_j = a + b * r**(j - 1) + c * (j == n),
+    for j in 1..n. Every argument broadcasts, so thousands of loans are solved at once."""
+    if all(numpy.ndim(x) == 0 for x in (kd, a, b, r, c, n, guess)):
+        return numpy.float64(_annuity_irr(*(float(x) for x in (kd, a, b, r, c)), int(n), guess, tol, maxiter))
+    kd, a, b, r, c, n = numpy.broadcast_arrays(*(numpy.asarray(x, dtype=numpy.float64)
+                                                 for x in (kd, a, b, r, c, n)))
+    log_r = numpy.log(r)
+
+    def npv(i):
+        log_v = -numpy.log1p(i)
+        return kd - a * _sum_powers(log_v, n) - b / r * _sum_powers(log_r + log_v, n) - c * numpy.exp(n * log_v)
+
+    return solve(npv, guess, tol, maxiter)
+
+
+def _annuity_irr(kd, a, b, r, c, n, guess, tol, maxiter):
+    "annuity_irr() of one loan, with floats"
+    log_r = math.log(r)
+
+    def npv(i):
+        if not i > -1:
+            return math.nan, math.nan
+        log_v = -math.log1p(i)
+        try:
+            (s, t), (sb, tb), vn = _powers(log_v, n), _powers(log_r + log_v, n), math.exp(n * log_v)
+            return kd - a * s - b / r * sb - c * vn, (a * t + b / r * tb + c * n * vn) / (1 + i)
+        except OverflowError:
+            return math.nan, math.nan
+
+    return _solve_scalar(npv, guess, tol, maxiter)
+
+
+def annual_rate(rate):
+    "annual effective rate of a monthly rate"
+    return (1 + rate) ** 12 - 1
@@ -1,3 +1,17 @@
+import functools
+import hashlib
+import logging
+import marshal
+import operator
+import os
+import tempfile
+import time
+from threading import Lock
+from types import MappingProxyType
+
+
+logger = logging.getLogger(__name__)
+
 
 def get_recursive_attr(obj, field, default=None, split='.'):
     "like getattr() but recursive to reated objects"
@@ -82,6 +96,7 @@ assert y.b == 3
 
 class Overwriter():
     CALLBACKS = {}
+    profiler = None     # a Profiler, to count and time the rules
 
     OP = {
         '|@': lambda x, y, *z: x.append(Overwriter.CALLBACKS.get(y)(*z)),
@@ -101,18 +116,28 @@ class Overwriter():
         '>': lambda x, *y: max(x, *y),
     }
 
-    def __init__(self, text):
+    def __init__(self, text, item=None):
+        "item: the already parsed text (see item()), to skip parsing"
         self.text = text
-        item = self._parse(text)
+        item = item or self._parse(text)
         self.when = item['when'] or ''
         self.what = item['what'] or 'cmp'
-        self.args = item['args'] or []
-        self.kwargs = item['kwargs'] or {}
-        self.ops = item['ops'] or {}
+        self.args = tuple(item['args'])
+        self.kwargs = MappingProxyType(item['kwargs'])
+        self.ops = MappingProxyType({op: MappingProxyType(values) for op, values in item['ops'].items()})
+        self.condition = compile_condition(self.what, self.args, self.kwargs)
 
     def __str__(self):
         return self.text
 
+    def item(self):
+        "the parsed rule, as plain data"
+        return {
+            'when': self.when, 'what': self.what,
+            'args': list(self.args), 'kwargs': dict(self.kwargs),
+            'ops': {op: dict(values) for op, values in self.ops.items()},
+        }
+
     @property
     def callback(self):
         return self.CALLBACKS[self.what]
@@ -123,17 +148,23 @@ class Overwriter():
         Overwriter.CALLBACKS[name] = foo
         return foo
 
+    @classmethod
+    @functools.lru_cache(maxsize=64)
+    def compile(cls, text):
+        "the RuleSet of a rule text (memoized)"
+        return RuleSet(text)
+
     @classmethod
     def trigger(cls, text='', event='', readable=None, writables=None):
-        writables = writables or [readable]
-        writers = [Overwriter(s.strip()) for s in text.split('\n') if s.strip()]
-        writers = [w for w in writers if w.when == event]
-        response = []
-        for w in writers:
-            if w.ask(readable):
-                w.apply(writables, readable)
-                response.append(str(w))
-        return response
+        "text: a rule text or a compiled RuleSet"
+        rules = text if isinstance(text, RuleSet) else cls.compile(text)
+        return rules.trigger(event, readable, writables)
+
+    @classmethod
+    def trigger_many(cls, text='', events=(), readable=None, writables=None):
+        "trigger() for each event, in order. Returns {event: response}"
+        rules = text if isinstance(text, RuleSet) else cls.compile(text)
+        return rules.trigger_many(events, readable, writables)
 
     @classmethod
     def _parse(cls, s):
@@ -165,31 +196,212 @@ class Overwriter():
                 for op in cls.OP:
                     if op in x:
                         a, b = x.split(op)
-                        d['ops'].setdefault(op, {})[a] = map(valuate, b.split())
+                        d['ops'].setdefault(op, {})[a] = tuple(map(valuate, b.split()))
                         break
         return d
 
     def ask(self, base):
-        if self.callback is None:
-            return None
-        return self.callback(base, *self.args, **self.kwargs)
+        return self.condition(base)
 
     def apply(self, writables, base):
         for op, values in self.ops.items():
-            operation = self.OP[op]
             for attr, value in values.items():
-                for w in writables:
-                    if hasattr(w, attr):
-                        old_value = getattr(w, attr)
-                        value = [baseline(x, b=base, w=w, x=old_value) for x in value]
-                        new_value = operation(old_value, *value)
-                        try:
-                            setattr(w, attr, new_value)
-                        except AttributeError:
-                            raise AttributeError(f'({attr}={new_value}) on "{self.text}"')
-                        break
-                else:
-                    logger.warning(f"Missing attribute {attr} on {writables}")
+                self.write(op, attr, value, writables, base)
+
+    def write(self, op, attr, value, writables, base):
+        "applies one operation on the first writable that has the attribute"
+        operation = self.OP[op]
+        for w in writables:
+            if hasattr(w, attr):
+                old_value = getattr(w, attr)
+                value = [baseline(x, b=base, w=w, x=old_value) for x in value]
+                new_value = operation(old_value, *value)
+                try:
+                    setattr(w, attr, new_value)
+                except AttributeError:
+                    raise AttributeError(f'({attr}={new_value}) on "{self.text}"')
+                break
+        else:
+            logger.warning(f"Missing attribute {attr} on {writables}")
+
+
+class RuleSet():
+    """The rules of a rule text, parsed once.
+    It's immutable, so it can be reused and shared across threads (only its counters change).
+    e.g.: Overwriter.trigger(RuleSet(text), 'event', readable, writables)
+    """
+    __slots__ = ('text', 'rules', 'events', 'callbacks', 'trees')
+    CACHE_VERSION = 1
+
+    def __init__(self, text='', items=None):
+        "items: the parsed lines, [(line, Overwriter.item())], to skip parsing"
+        if items is None:
+            rules = tuple(Overwriter(s.strip()) for s in text.split('\n') if s.strip())
+        else:
+            rules = tuple(Overwriter(line, item) for line, item in items)
+        events, callbacks = {}, {}
+        for w in rules:
+            events.setdefault(w.when, []).append(w)
+            callbacks.setdefault(w.what, []).append(w)
+        object.__setattr__(self, 'text', text)
+        object.__setattr__(self, 'rules', rules)
+        object.__setattr__(self, 'events', MappingProxyType({k: tuple(v) for k, v in events.items()}))
+        object.__setattr__(self, 'callbacks', MappingProxyType({k: tuple(v) for k, v in callbacks.items()}))
+        object.__setattr__(self, 'trees', MappingProxyType({k: ConditionTree(v) for k, v in events.items()}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"RuleSet is immutable, can't set '{name}'")
+
+    @staticmethod
+    def cache_path(text, cache_dir):
+        "the cache file of a rule text, named after its content hash"
+        return os.path.join(cache_dir, hashlib.sha256(text.encode()).hexdigest() + '.rules')
+
+    @classmethod
+    def load(cls, text, cache_dir):
+        """the RuleSet of text, from its cache file in cache_dir when there's a good one.
+        Otherwise the text is parsed and the cache file (re)written.
+        Callbacks are looked up by name, so they must be registered before loading."""
+        path = cls.cache_path(text, cache_dir)
+        try:
+            with open(path, 'rb') as f:
+                version, key, items = marshal.load(f)
+            if version != cls.CACHE_VERSION or key != os.path.basename(path):
+                raise ValueError('stale cache')
+            return cls(text, items)
+        except (OSError, EOFError, ValueError, TypeError, KeyError, AttributeError):
+            pass
+        rules = cls(text)
+        try:
+            rules.dump(cache_dir)
+        except OSError as e:
+            logger.warning(f"RuleSet.load: can't write the cache on {cache_dir}: {e}")
+        return rules
+
+    def dump(self, cache_dir):
+        "writes the parsed rules on their cache file in cache_dir"
+        path = self.cache_path(self.text, cache_dir)
+        items = [(w.text, w.item()) for w in self.rules]
+        data = marshal.dumps((self.CACHE_VERSION, os.path.basename(path), items))
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return path
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    @property
+    def evaluations(self):
+        "conditions evaluated so far"
+        return sum(tree.evaluations for tree in self.trees.values())
+
+    @property
+    def saved(self):
+        "condition evaluations avoided so far by sharing them between rules"
+        return sum(tree.saved for tree in self.trees.values())
+
+    def trigger(self, event='', readable=None, writables=None):
+        "applies the rules of this event only"
+        writables = writables or [readable]
+        tree = self.trees.get(event)
+        if tree is None:
+            return []
+        if Overwriter.profiler is not None:
+            return self._trigger_profiled(tree, event, readable, writables, Overwriter.profiler)
+        response = []
+        memo, counts = {}, [0, 0]
+        try:
+            for i, w in enumerate(tree.rules):
+                if tree.ask(i, readable, memo, counts):
+                    w.apply(writables, readable)
+                    memo.clear()    # the rule may have changed what the next ones read
+                    response.append(str(w))
+        finally:
+            tree.count(*counts)
+        return response
+
+    def _trigger_profiled(self, tree, event, readable, writables, profiler):
+        response = []
+        memo, counts = {}, [0, 0]
+        try:
+            for i, w in enumerate(tree.rules):
+                start = time.perf_counter()
+                matched = tree.ask(i, readable, memo, counts)
+                asked = time.perf_counter()
+                if matched:
+                    w.apply(writables, readable)
+                    memo.clear()
+                    response.append(str(w))
+                profiler.record(w, event, matched, asked - start, time.perf_counter() - asked)
+        finally:
+            tree.count(*counts)
+        return response
+
+    def trigger_many(self, events=(), readable=None, writables=None):
+        "trigger() for each event, in order. Returns {event: response}"
+        return {event: self.trigger(event, readable, writables) for event in events}
+
+
+class RuleStats():
+    __slots__ = ('evaluations', 'matches', 'condition_time', 'apply_time')
+
+    def __init__(self):
+        self.evaluations = 0
+        self.matches = 0
+        self.condition_time = 0.0
+        self.apply_time = 0.0
+
+    @property
+    def time(self):
+        return self.condition_time + self.apply_time
+
+
+class Profiler():
+    """Counts and times every rule triggered while it's set as Overwriter.profiler.
+    trace: an optional callback(rule text, event, matched, elapsed seconds) for every rule.
+    e.g.: Overwriter.profiler = Profiler(); ...; print(Overwriter.profiler.report())
+    """
+
+    def __init__(self, trace=None):
+        self.trace = trace
+        self.stats = {}     # rule text --> RuleStats
+        self._lock = Lock()
+
+    def record(self, w, event, matched, condition_time, apply_time):
+        with self._lock:
+            stats = self.stats.get(w.text)
+            if stats is None:
+                stats = self.stats[w.text] = RuleStats()
+            stats.evaluations += 1
+            stats.matches += bool(matched)
+            stats.condition_time += condition_time
+            stats.apply_time += apply_time
+        if self.trace is not None:
+            self.trace(w.text, event, bool(matched), condition_time + apply_time)
+
+    def hot(self, n=None, key='time'):
+        "[(rule text, RuleStats)] sorted by key (time, evaluations, matches...), highest first"
+        with self._lock:
+            items = list(self.stats.items())
+        return sorted(items, key=lambda x: getattr(x[1], key), reverse=True)[:n]
+
+    def report(self, n=20, key='time'):
+        "the hot rules as a text table"
+        lines = [f'{"evals":>8} {"matches":>8} {"cond ms":>10} {"apply ms":>10}  rule']
+        for text, x in self.hot(n, key):
+            lines.append(f'{x.evaluations:>8} {x.matches:>8} {x.condition_time * 1e3:>10.3f} '
+                         f'{x.apply_time * 1e3:>10.3f}  {text}')
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self.stats.clear()
 
 
 _OP = {
@@ -234,6 +446,194 @@ def f_between(x_, attr, interval):
 def f_not(x_, function, *args, **kwargs):
     return not Overwriter.CALLBACKS[function](x_, *args, **kwargs)
 
+
+
+####### COMPILED CONDITIONS ###############
+
+def _getter(path):
+    "get_recursive_attr(x, path) with a precomputed attrgetter"
+    get = operator.attrgetter(path)
+
+    def _get(x):
+        try:
+            return get(x)
+        except AttributeError:
+            return None
+    return _get
+
+
+def compile_interval(interval, cast=int):
+    "between(value, interval) with the interval parsed once"
+    if not isinstance(interval, str):
+        return lambda value: between(value, interval, cast)
+    try:
+        if interval.isdigit():
+            x = int(interval)
+            return lambda value: value == x
+        a, b = interval.split('..')
+        a = cast(a) if a else None
+        b = cast(b) if b else None
+    except ValueError:
+        return lambda value: False
+
+    def _between(value):
+        lo = value if a is None else a
+        hi = value + 1 if b is None else b
+        return lo <= value < hi
+    return _between
+
+
+def _check(attr, value2):
+    "one keyword of f_cmp as a closure"
+    s = attr.split('.')
+    if len(s) > 1 and s[-1] in _OP:
+        op = s[-1]
+        get = _getter(attr.rstrip(f'{op}').strip('.'))
+        if op == 'btw':
+            inside = compile_interval(value2)
+            return lambda x_: inside(get(x_))
+        cmp = _OP[op]
+        return lambda x_: cmp(get(x_), value2)
+    get = _getter(attr)
+    return lambda x_: get(x_) == value2
+
+
+def compile_cmp(**attrs):
+    "f_cmp(x_, **attrs) as a closure"
+    checks = [_check(attr, value2) for attr, value2 in attrs.items()]
+
+    def _cmp(x_):
+        try:
+            for check in checks:
+                if not check(x_):
+                    return False
+        except (AttributeError, TypeError) as e:
+            print('Error on cmp', x_, attrs, e)
+            return False
+        return True
+    return _cmp
+
+
+def compile_between(attr, interval):
+    "f_between(x_, attr, interval) as a closure"
+    if not isinstance(attr, str):
+        return lambda x_: f_between(x_, attr, interval)
+    get = _getter(attr)
+    inside = compile_interval(interval)
+    return lambda x_: inside(get(x_))
+
+
+def compile_not(function, *args, **kwargs):
+    "f_not(x_, function, *args, **kwargs) as a closure"
+    condition = compile_condition(function, args, kwargs)
+    return lambda x_: not condition(x_)
+
+
+def compile_condition(what, args, kwargs):
+    """the condition of a rule as a predicate x_ --> bool.
+    Built-in callbacks are compiled into closures once. The callback is still looked up
+    in Overwriter.CALLBACKS on every call, so the closure is only used while it's the built-in."""
+    callbacks = Overwriter.CALLBACKS
+    builtin = callbacks.get(what)
+    compiler = COMPILERS.get(builtin)
+    if compiler is not None:
+        try:
+            compiled = compiler(*args, **kwargs)
+        except TypeError:   # wrong arguments, let the callback itself complain
+            compiled = None
+        if compiled is not None:
+            def condition(x_):
+                callback = callbacks[what]
+                if callback is builtin:
+                    return compiled(x_)
+                return callback(x_, *args, **kwargs)
+            return condition
+    return lambda x_: callbacks[what](x_, *args, **kwargs)
+
+
+COMPILERS = {
+    f_cmp: compile_cmp,
+    f_between: compile_between,
+    f_not: compile_not,
+}
+
+
+def conjuncts(w):
+    """the condition of the rule w as a list of (key, predicate) to be and-ed.
+    Every keyword of a cmp (without positional args) is a conjunct, other conditions are a
+    single one. Equal keys mean equal predicates."""
+    if w.what == 'cmp' and not w.args and Overwriter.CALLBACKS.get('cmp') is f_cmp:
+        return [(('cmp', attr, type(value), value), compile_cmp(**{attr: value}))
+                for attr, value in w.kwargs.items()]
+    key = (w.what, tuple((type(x), x) for x in w.args), tuple((k, type(v), v) for k, v in w.kwargs.items()))
+    return [(key, w.condition)]
+
+
+class ConditionTree():
+    """The conditions of a list of rules, split in conjuncts and arranged as a tree:
+    rules that start with the same conjuncts share those nodes, and equal conjuncts share
+    their predicate. Conjuncts are ordered most common first, to share as much as possible.
+    Within a memo (one readable), every node and every predicate is evaluated once.
+    If 'cmp' is no longer the callback it was split with, rules are asked one by one.
+    Each trigger counts its evaluations apart and adds them up once, under a lock.
+    """
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.cmp = Overwriter.CALLBACKS.get('cmp')
+        self.evaluations = 0
+        self.saved = 0
+        self._lock = Lock()
+        self.predicates = {}        # key --> predicate
+        self.keys = []              # node --> key
+        self.paths = []             # rule --> nodes, root first
+        by_rule = [conjuncts(w) for w in self.rules]
+        count = {}
+        for i, items in enumerate(by_rule):
+            for key, predicate in items:
+                self.predicates.setdefault(key, predicate)
+                count[key] = count.get(key, 0) + 1
+        order = {key: i for i, key in enumerate(self.predicates)}
+        children = {}               # (parent node, key) --> node
+        for items in by_rule:
+            keys = sorted({key for key, _ in items}, key=lambda k: (-count[k], order[k]))
+            node, path = None, []
+            for key in keys:
+                node = children.setdefault((node, key), len(self.keys))
+                if node == len(self.keys):
+                    self.keys.append(key)
+                path.append(node)
+            self.paths.append(tuple(path))
+
+    def ask(self, i, x, memo, counts):
+        """the condition of the i-th rule on x, reusing and filling the memo.
+        counts: [evaluations, saved] of this trigger, updated in place"""
+        if Overwriter.CALLBACKS.get('cmp') is not self.cmp:
+            counts[0] += 1
+            return bool(self.rules[i].ask(x))
+        for node in self.paths[i]:
+            if node in memo:
+                counts[1] += 1
+                result = memo[node]
+            else:
+                key = self.keys[node]
+                if key in memo:
+                    counts[1] += 1
+                    result = memo[key]
+                else:
+                    counts[0] += 1
+                    result = memo[key] = bool(self.predicates[key](x))
+                memo[node] = result
+            if not result:
+                return False
+        return True
+
+    def count(self, evaluations, saved):
+        "adds the counts of a trigger"
+        with self._lock:
+            self.evaluations += evaluations
+            self.saved += saved
+
 Overwriter.add(f_cmp, 'cmp')
 Overwriter.add(f_not, 'not')
-Overwriter.add(f_between, 'between')
\ No newline at end of file
+Overwriter.add(f_between, 'between')
@@ -0,0 +1,87 @@
+import numpy
+from collections import namedtuple
+
+
+Installment = namedtuple('Installment',
+    'month, amount, interest, capital, life, fire, serv, remaining_capital, ' +
+    'itax, ftax, stax, tax')
+
+FIELDS = Installment._fields
+
+
+def to_installments(data):
+    "compatibility view of a (fields x months) block as a list of Installment namedtuples"
+    return [Installment(int(row[0]), *row[1:]) for row in zip(*data.tolist())]
+
+
+class InstallmentView():
+    "a lightweight row of a RepaymentPlan with the attributes of an Installment"
+    __slots__ = ('_row',)
+
+    def __init__(self, row):
+        self._row = row
+
+    def __repr__(self):
+        return repr(self.installment())
+
+    def installment(self):
+        return to_installments(self._row[:, None])[0]
+
+
+class RepaymentPlan():
+    """Installments in one contiguous float64 block, one row per field, one column per month,
+    so plan.amount, plan.interest... are contiguous zero-copy views.
+    plan[i] is an InstallmentView (a strided view) and plan[i:j] a RepaymentPlan sharing the block.
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def empty(cls, n):
+        return cls(numpy.empty((len(FIELDS), n), dtype=numpy.float64))
+
+    @classmethod
+    def of(cls, plan):
+        "the plan itself, or a RepaymentPlan out of a list of Installments"
+        if isinstance(plan, cls):
+            return plan
+        return cls(numpy.ascontiguousarray(numpy.array(plan, dtype=numpy.float64).reshape(-1, len(FIELDS)).T))
+
+    @classmethod
+    def frombuffer(cls, buffer):
+        "a (read only) plan over raw bytes, as exported by tobytes() or memoryview()"
+        return cls(numpy.frombuffer(buffer, dtype=numpy.float64).reshape(len(FIELDS), -1))
+
+    def __len__(self):
+        return self.data.shape[1]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return RepaymentPlan(self.data[:, i])
+        return InstallmentView(self.data[:, i])
+
+    def __iter__(self):
+        return map(InstallmentView, self.data.T)
+
+    def __repr__(self):
+        return f'<RepaymentPlan: {len(self)} installments>'
+
+    def installments(self):
+        return to_installments(self.data)
+
+    def tobytes(self):
+        return self.data.tobytes()
+
+    def memoryview(self):
+        return memoryview(numpy.ascontiguousarray(self.data)).cast('B')
+
+
+for _i, _field in enumerate(FIELDS):
+    setattr(RepaymentPlan, _field, property(lambda self, i=_i: self.data[i]))
+    if _field == 'month':
+        setattr(InstallmentView, _field, property(lambda self, i=_i: int(self._row[i])))
+    else:
+        setattr(InstallmentView, _field, property(lambda self, i=_i: float(self._row[i])))
+del _i, _field
@@ -0,0 +1,109 @@
+import itertools
+import os
+import numpy
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+
+
+"""
+Cash flow projection of a whole loan book.
+
+Loans are (product, k, n) or (product, k, n, age), where age is the number of installments
+already paid. A plan is affine in its capital, so the loans of a product that share
+(n, age) add up to count * plan(0) + sum(k) * (plan(1) - plan(0)): every group costs two
+closed-form tables, no matter how many loans it has.
+"""
+
+COLUMNS = ('amount', 'interest', 'capital', 'insurance', 'tax')
+
+
+def _totals(plan):
+    return numpy.column_stack([plan.amount, plan.interest, plan.capital, plan.life + plan.fire, plan.tax])
+
+
+def project_group(product, ks, ns, ages, horizon):
+    "monthly totals (horizon x COLUMNS) of many loans of the same product"
+    out = numpy.zeros((horizon, len(COLUMNS)))
+    keys, inverse = numpy.unique(numpy.stack([ns, ages], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    sum_k = numpy.bincount(inverse, weights=ks, minlength=len(keys))
+    count = numpy.bincount(inverse, minlength=len(keys))
+    calc, exp = product.calculator, product.exp
+    for (n, age), k, c in zip(keys, sum_k, count):
+        months = numpy.arange(age + 1, min(n, age + horizon) + 1)
+        if not len(months):
+            continue
+        fixed = _totals(calc.repayment_table(0.0, n, product.tna, exp, product.collateral, months))
+        unit = _totals(calc.repayment_table(1.0, n, product.tna, exp, product.collateral, months))
+        out[:len(months)] += c * fixed + k * (unit - fixed)
+    return out
+
+
+def _tasks(loans, chunksize):
+    "reads the loans chunksize at a time, yields a list of (product, ks, ns, ages) per chunk"
+    loans = iter(loans)
+    while True:
+        chunk = list(itertools.islice(loans, chunksize))
+        if not chunk:
+            return
+        groups = {}
+        for product, k, n, *age in chunk:
+            groups.setdefault(id(product), (product, []))[1].append((k, n, age[0] if age else 0))
+        tasks = []
+        for product, rows in groups.values():
+            ks, ns, ages = zip(*rows)
+            tasks.append((product, numpy.array(ks, dtype=numpy.float64),
+                          numpy.array(ns, dtype=int), numpy.array(ages, dtype=int)))
+        yield tasks
+
+
+class _SerialExecutor():
+    "runs the tasks in this process, with the executor interface"
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def iter_projection(loans, horizon, chunksize=100000, processes=None):
+    """Projects the monthly totals of a loan book over `horizon` months.
+    Chunks are spread over a pool of processes (processes=0 runs them here), with at most
+    two chunks per process in flight, so memory stays bounded for any book size.
+    Yields (loans projected so far, their totals so far) every time a chunk is done."""
+    processes = (os.cpu_count() or 1) if processes is None else processes
+    totals = numpy.zeros((horizon, len(COLUMNS)))
+    done = 0
+    pending = {}
+
+    def collect(futures):
+        nonlocal totals, done
+        for future in futures:
+            totals += future.result()
+            done += pending.pop(future)
+
+    executor = ProcessPoolExecutor(processes) if processes else _SerialExecutor()
+    with executor:
+        for tasks in _tasks(loans, chunksize):
+            for product, ks, ns, ages in tasks:
+                pending[executor.submit(project_group, product, ks, ns, ages, horizon)] = len(ks)
+            while len(pending) > 2 * max(processes, 1):
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+                yield done, totals.copy()
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+            yield done, totals.copy()
+
+
+def project(loans, horizon, chunksize=100000, processes=None):
+    "the final totals of iter_projection() as a dict of monthly arrays, one per column"
+    totals = numpy.zeros((horizon, len(COLUMNS)))
+    for _, totals in iter_projection(loans, horizon, chunksize, processes):
+        pass
+    return dict(zip(COLUMNS, totals.T))
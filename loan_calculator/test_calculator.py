@@ -0,0 +1,265 @@
+import copy
+import numpy
+import pickle
+
+from unittest import TestCase
+from .cache import QuoteCache
+from .calculator import Installment, Product, best_offers
+from .plan import RepaymentPlan
+from .irr import annual_rate, annuity_irr, irr
+
+
+EXPENSES = dict(
+    life=0.0003, fire=0.0002, sivr=0.00001, serv=50,
+    origination_pct=0.03, origination_min=1000, notary_pct=0.01, notary_min=300, notary_fixed=20,
+)
+
+
+def loop_plan(k, n, tna, exp, p):
+    "the month by month french plan, as a reference"
+    t = tna / 12
+    base = k * t / (1 - (1 + t) ** -n)
+    rk = k
+    for j in range(1, n + 1):
+        ii = rk * t
+        ki = base - ii
+        life = rk * exp.life
+        fire = rk * exp.fire + exp.sivr * p
+        tax = ii * exp.itax + (fire + exp.serv) * exp.etax
+        rk = rk - ki
+        yield Installment(j, ki + ii + life + fire + exp.serv + tax, ii, ki, life, fire, exp.serv, rk,
+                          ii * exp.itax, fire * exp.etax, exp.serv * exp.etax, tax)
+
+
+def loop_plan_american(k, n, tna, exp, p):
+    "the month by month american plan, as a reference"
+    t = tna / 12
+    ix = k * t
+    life = k * exp.life
+    fire = k * exp.fire + exp.sivr * p
+    tax = (fire + exp.serv) * exp.etax + ix * exp.itax
+    for j in range(1, n):
+        yield Installment(j, ix + tax + life + fire + exp.serv, ix, 0.0, life, fire, exp.serv, k,
+                          ix * exp.itax, fire * exp.etax, exp.serv * exp.etax, tax)
+    yield Installment(n, k + ix, ix, k, life, fire, exp.serv, 0.0,
+                      ix * tax, fire * exp.etax, exp.serv * exp.etax, tax)
+
+
+class RepaymentTable(TestCase):
+    def setUp(self):
+        self.french = Product(tna=0.45, collateral=2e6, **EXPENSES)
+        self.american = Product(tna=0.45, collateral=2e6, depreciation='AM', **EXPENSES)
+
+    def assertPlanAlmostEqual(self, got, want):
+        self.assertEqual(len(got), len(want))
+        for x, y in zip(got, want):
+            self.assertEqual(x.month, y.month)
+            for a, b in zip(x, y):
+                self.assertAlmostEqual(a, b, delta=1e-6 * max(1, abs(b)))
+
+    def test_french_table(self):
+        p = self.french
+        want = list(loop_plan(1e6, 360, p.tna, p.exp, p.collateral))
+        self.assertPlanAlmostEqual(p.repayment_plan(1e6, 360), want)
+        table = p.repayment_plan(1e6, 360, table=True)
+        self.assertAlmostEqual(table.capital.sum(), 1e6, places=3)
+        self.assertAlmostEqual(table.amount[0], p.first_payment(1e6, 360), places=6)
+
+    def test_american_table(self):
+        table = self.american.repayment_plan(1e6, 12, table=True)
+        self.assertEqual(list(table.capital), [0.0] * 11 + [1e6])
+        self.assertEqual(list(table.remaining_capital), [1e6] * 11 + [0.0])
+        self.assertAlmostEqual(table.amount[0], self.american.first_payment(1e6, 12))
+        self.assertAlmostEqual(table.amount[-1], table.interest[-1] + 1e6)
+        for n in [1, 12, 360]:
+            p = self.american
+            want = list(loop_plan_american(1e6, n, p.tna, p.exp, p.collateral))
+            self.assertPlanAlmostEqual(p.repayment_plan(1e6, n), want)
+            self.assertPlanAlmostEqual(list(p.iter_repayment_plan(1e6, n, start=n)), want[-1:])
+            self.assertEqual(p.cft(1e6, n), p.cft(1e6, n, plan=want))
+
+
+class QuoteGrid(TestCase):
+    def test_grid_matches_scalar(self):
+        p = Product(tna=0.45, collateral=2e6, **EXPENSES)
+        ks, ns = [1e4, 5e5, 3e6], [12, 120, 360]
+        grid = p.calculate_grid(ks, ns)
+        self.assertEqual(grid.capital.shape, (3, 3))
+        for i, n in enumerate(ns):
+            for j, k in enumerate(ks):
+                self.assertEqual(grid.term[i, j], n)
+                self.assertAlmostEqual(grid.disbursable[i, j], p.disbursable_capital(k))
+                self.assertAlmostEqual(grid.first_payment[i, j], p.first_payment(k, n), places=6)
+                self.assertAlmostEqual(grid.avg_payment[i, j], p.avg_payment(k, n))
+
+
+class Cft(TestCase):
+    def test_annuity_solver_matches_cash_flows(self):
+        for depreciation in ['FR', 'AM']:
+            p = Product(tna=0.45, collateral=2e6, depreciation=depreciation, **EXPENSES)
+            for n in [1, 12, 360]:
+                plan = p.repayment_plan(1e6, n, table=True)
+                kd = p.disbursable_capital(1e6)
+                self.assertAlmostEqual(
+                    annuity_irr(kd, *p.cashflows(1e6, n), n=n),
+                    irr([kd] + list(-plan.amount))[0],
+                    places=10,
+                )
+                self.assertEqual(p.cft(1e6, n), p.cft(1e6, n, plan=plan))
+                self.assertEqual(p.cft(1e6, n), p.cft(1e6, n, guess=0.8))
+
+    def test_without_expenses(self):
+        p = Product(tna=0.3, otax=0, itax=0, etax=0)
+        self.assertAlmostEqual(annuity_irr(1e6, *p.cashflows(1e6, 120), n=120), 0.3 / 12, places=12)
+
+    def test_scalar_matches_vectorized(self):
+        p = Product(tna=0.45, collateral=2e6, **EXPENSES)
+        for k, n, guess in [(1e5, 12, None), (1e6, 360, None), (1e6, 60, 0.9), (1e6, 60, -0.7)]:
+            args = (p.disbursable_capital(k), *p.cashflows(k, n))
+            self.assertAlmostEqual(annuity_irr(*args, n=n, guess=guess),
+                                   annuity_irr([args[0]], *args[1:], n=n, guess=guess)[0], places=12)
+        # a bracket that has to be widened, and one with no rate in it
+        self.assertAlmostEqual(annuity_irr(1e6, 1e8, n=12), annuity_irr([1e6], 1e8, n=12)[0], places=9)
+        self.assertTrue(numpy.isnan(annuity_irr(1e6, 0, n=12)))
+
+    def test_vectorized(self):
+        p = Product(tna=0.45, collateral=2e6, **EXPENSES)
+        ks, ns = numpy.array([1e5, 1e6, 2e6]), numpy.array([12, 60, 360])
+        rates = annuity_irr(p.disbursable_capital(ks), *p.cashflows(ks, ns), n=ns)
+        for rate, k, n in zip(rates, ks, ns):
+            self.assertEqual(round(annual_rate(rate), 3), p.cft(k, n))
+
+
+class Aggregates(TestCase):
+    def test_aggregates_match_the_plan(self):
+        for depreciation in ['FR', 'AM']:
+            p = Product(tna=0.45, collateral=2e6, depreciation=depreciation, **EXPENSES)
+            for n in [1, 12, 360]:
+                plan = p.repayment_plan(1e6, n, table=True)
+                agg = p.aggregates(1e6, n)
+                first = plan.amount[0] if n > 1 else p.first_payment(1e6, n)  # without the final capital
+                want = [first, plan.amount[-1], plan.amount.mean(), plan.amount.sum(),
+                        plan.interest.sum(), (plan.life + plan.fire).sum(), plan.tax.sum()]
+                for got, x in zip(agg, want):
+                    self.assertAlmostEqual(got, x, delta=1e-9 * abs(x))
+                self.assertEqual(p.avg_payment(1e6, n), p.avg_payment(plan=plan))
+
+    def test_first_payment(self):
+        for depreciation in ['FR', 'AM']:
+            p = Product(tna=0.45, collateral=2e6, depreciation=depreciation)
+            for n in [1, 12]:
+                self.assertEqual(p.calculate(1e5, n).first_payment, p.first_payment(1e5, n))
+                self.assertEqual(p.calculate_grid([1e5], [n]).first_payment[0, 0], p.first_payment(1e5, n))
+        self.assertEqual(p.calculate(1e5, 1).first_payment, 4537.5)
+
+
+class IterRepaymentPlan(TestCase):
+    def test_iter(self):
+        for depreciation in ['FR', 'AM']:
+            p = Product(tna=0.45, collateral=2e6, depreciation=depreciation, **EXPENSES)
+            plan = p.repayment_plan(1e6, 30)
+            self.assertEqual(list(p.iter_repayment_plan(1e6, 30)), plan)
+            self.assertEqual(list(p.iter_repayment_plan(1e6, 30, start=17)), plan[16:])
+            self.assertEqual(list(p.iter_repayment_plan(1e6, 30, start=31)), [])
+            for start in [0, -5]:
+                with self.assertRaises(ValueError):
+                    list(p.iter_repayment_plan(1e6, 30, start=start))
+
+
+class Cache(TestCase):
+    def test_cache(self):
+        p = Product(tna=0.45, collateral=2e6, **EXPENSES)
+        p.cache = QuoteCache(maxsize=2)
+        first = p.calculate(1e6, 120)
+        self.assertEqual(vars(p.calculate(1e6, 120)), vars(first))
+        self.assertEqual(p.cache.stats(), {'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 1, 'evictions': 0})
+
+        p.exp.life = 0.001     # like an Overwriter would
+        self.assertNotEqual(p.calculate(1e6, 120).avg_payment, first.avg_payment)
+        other = Product(tna=0.45, collateral=2e6, **dict(EXPENSES, life=0.001))
+        self.assertEqual(p.first_payment(1e6, 120), other.first_payment(1e6, 120))
+        self.assertEqual(p.cache.evictions, 1)
+        self.assertEqual(len(p.cache), 2)
+
+
+class Expenses(TestCase):
+    def test_derived(self):
+        p = Product(tna=0.45, **EXPENSES)
+        exp = p.exp
+        self.assertEqual(exp.coefficients, (1.21, 1, 1.21, 20))
+        breakpoints = p.calculator.revert_breakpoints(exp)
+        self.assertIs(p.calculator.revert_breakpoints(exp), breakpoints)
+        kd = p.disbursable_capital(1e6)
+
+        exp.Fa = 100                # the alias writes origination_fixed
+        self.assertEqual(exp.origination_fixed, 100)
+        self.assertEqual(exp.coefficients.fixed, 100 * 1.21 + 20)
+        self.assertIsNot(p.calculator.revert_breakpoints(exp), breakpoints)
+        self.assertAlmostEqual(p.disbursable_capital(1e6), kd - 121, places=6)
+        self.assertAlmostEqual(p.revert_capital(kd - 121), 1e6, places=6)
+
+        for other in [copy.deepcopy(exp), pickle.loads(pickle.dumps(exp))]:
+            self.assertEqual(other.fingerprint(), exp.fingerprint())
+            other.life = 1
+            self.assertNotEqual(other.fingerprint(), exp.fingerprint())
+        with self.assertRaises(AttributeError):
+            exp.colour = 'red'
+
+    def test_unknown_expenses(self):
+        with self.assertLogs('loan_calculator.overwriters', 'WARNING'):
+            p = Product(tna=0.4, code='X', life=0.001)
+        self.assertEqual(p.exp.life, 0.001)
+        self.assertEqual([name for name, _ in p.exp.fingerprint()], list(p.exp.FIELDS))
+
+
+class ColumnarPlan(TestCase):
+    def test_views(self):
+        p = Product(tna=0.45, collateral=2e6, **EXPENSES)
+        plan = p.repayment_plan(1e6, 24, table=True)
+        installments = p.repayment_plan(1e6, 24)
+        self.assertEqual(len(plan), 24)
+        self.assertEqual(plan.installments(), installments)
+        self.assertIs(plan.interest.base, plan.data)
+        self.assertTrue(plan.amount.flags.c_contiguous)
+        self.assertTrue(plan[12:].interest.flags.c_contiguous)
+        self.assertEqual(plan[3].month, 4)
+        self.assertEqual(plan[-1].installment(), installments[-1])
+        self.assertEqual([x.amount for x in plan[12:]], [x.amount for x in installments[12:]])
+        self.assertEqual(RepaymentPlan.of(installments).installments(), installments)
+        self.assertEqual(RepaymentPlan.frombuffer(plan.memoryview()).installments(), installments)
+        self.assertEqual(RepaymentPlan.frombuffer(plan[6:12].tobytes()).installments(), installments[6:12])
+
+
+class RevertCapital(TestCase):
+    def test_revert_capitals(self):
+        for expenses in [EXPENSES, dict(origination_pct=0.01, origination_min=20000), {}]:
+            p = Product(tna=0.45, **expenses)
+            kds = numpy.linspace(1e3, 3e6, 2001)
+            got = p.revert_capitals(kds)
+            for kd, k in zip(kds, got):
+                self.assertAlmostEqual(k, p.revert_capital(kd), places=6)
+                self.assertAlmostEqual(p.disbursable_capital(k), kd, places=6)
+
+    def test_grid_from_disbursable(self):
+        p = Product(tna=0.45, collateral=2e6, **EXPENSES)
+        grid = p.calculate_grid_from_disbursable([5e4, 1e6], [12, 60])
+        self.assertEqual(grid.cft[1, 0], p.calculate_from_disbursable(5e4, 60).cft)
+        self.assertAlmostEqual(grid.disbursable[0, 1], 1e6, places=6)
+
+
+class BestOffers(TestCase):
+    def test_best_offers(self):
+        p = Product(tna=0.45, collateral=2e6, **EXPENSES)
+        offers = p.best_offers(50000, [360, 12, 60, 120, 240])
+        self.assertEqual([x.term for x in offers], [360, 240, 120, 60, 12])
+        for x in offers:
+            self.assertAlmostEqual(x.first_payment, 50000, places=6)
+
+        capped = p.best_offers(50000, [12, 60, 120, 240, 360], ltv=0.5, top=2)
+        self.assertEqual([(x.term, x.capital) for x in capped], [(120, 1e6), (60, capped[1].capital)])
+
+    def test_across_products(self):
+        cheap = Product(tna=0.30, collateral=2e6, **EXPENSES)
+        expensive = Product(tna=0.60, collateral=2e6, **EXPENSES)
+        offers = best_offers([expensive, cheap], 50000, [60, 120], top=3)
+        self.assertEqual([(p, r.term) for p, r in offers], [(cheap, 120), (cheap, 60), (expensive, 120)])
@@ -0,0 +1,54 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import TestCase, mock
+from .calculator import Product
+from .compare import acompare, compare
+from .test_calculator import EXPENSES
+
+
+RULES = """
+pricing.cmp(segment=gold): tna*0.5
+pricing.cmp(segment=gold, age.lt=30): life=0
+"""
+
+
+class Compare(TestCase):
+    def setUp(self):
+        self.products = [
+            Product(tna=tna, collateral=2e6, depreciation=depreciation, **EXPENSES)
+            for tna in [0.8, 0.3, 0.6, 0.45, 0.2] for depreciation in ['FR', 'AM']
+        ]
+        self.applicant = SimpleNamespace(segment='gold', age=25)
+
+    def test_compare(self):
+        offers = compare(self.products, self.applicant, 60, k=1e6, rules=RULES, event='pricing')
+        self.assertEqual(len(offers), 10)
+        self.assertEqual(offers[0][0].tna, 0.1)
+        self.assertEqual([r.cft for _, r in offers], sorted(r.cft for _, r in offers))
+        for p, r in offers:
+            self.assertEqual(p.exp.life, 0)
+            self.assertEqual(r.cft, p.calculate(1e6, 60).cft)
+        self.assertEqual([p.tna for p in self.products[::2]], [0.8, 0.3, 0.6, 0.45, 0.2])
+        self.assertEqual(self.products[0].exp.life, EXPENSES['life'])
+
+        with ThreadPoolExecutor(4) as executor:
+            threaded = compare(self.products, self.applicant, 60, k=1e6, rules=RULES, event='pricing',
+                               executor=executor)
+        self.assertEqual([vars(r) for _, r in threaded], [vars(r) for _, r in offers])
+
+        from_kd = compare(self.products, None, 60, kd=5e5)
+        self.assertAlmostEqual(from_kd[0][1].disbursable, 5e5, places=6)
+
+    def test_top(self):
+        want = compare(self.products, n=60, k=1e6)[:3]
+        with mock.patch.object(Product, 'calculate', autospec=True, side_effect=Product.calculate) as calculate:
+            got = compare(self.products, n=60, k=1e6, top=3, inflight=1)
+        self.assertEqual([vars(r) for _, r in got], [vars(r) for _, r in want])
+        self.assertEqual(calculate.call_count, 4)      # the 0.2s, the 0.3s, and no more
+
+    def test_async(self):
+        offers = asyncio.run(acompare(self.products, self.applicant, 60, k=1e6, rules=RULES,
+                                      event='pricing', top=2))
+        self.assertEqual([p.tna for p, _ in offers], [0.1, 0.1])
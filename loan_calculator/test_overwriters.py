@@ -0,0 +1,275 @@
+import numpy
+import os
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import TestCase, mock
+from .batch import trigger_batch
+from .calculator import Expense
+from .overwriters import Overwriter, Profiler, RuleSet, f_between, f_cmp
+
+
+RULES = """
+pricing.cmp(code=A, term.gte=12): tna=0.3, fee+10
+pricing.cmp(code=A, term.lt=12): tna=0.4
+pricing.between(term, 12..24): fee*2
+eligibility.cmp(code=B): max_ltv<0.5 0.6
+"""
+
+
+def application(**kwargs):
+    return SimpleNamespace(**dict(dict(code='A', term=12, tna=0.5, fee=100, max_ltv=0.8), **kwargs))
+
+
+class Doubled(SimpleNamespace):
+    dbl = property(lambda self: self.k * 2)
+
+
+class Trigger(TestCase):
+    def test_trigger(self):
+        x = application()
+        response = Overwriter.trigger(RULES, 'pricing', x)
+        self.assertEqual(response, [
+            'pricing.cmp(code=A, term.gte=12): tna=0.3, fee+10',
+            'pricing.between(term, 12..24): fee*2',
+        ])
+        self.assertEqual((x.tna, x.fee, x.max_ltv), (0.3, 220, 0.8))
+
+    def test_writables(self):
+        x, w = application(code='B'), SimpleNamespace(max_ltv=0.9)
+        self.assertEqual(len(Overwriter.trigger(RULES, 'eligibility', x, [w])), 1)
+        self.assertEqual((x.max_ltv, w.max_ltv), (0.8, 0.5))
+
+
+class CompiledRules(TestCase):
+    def test_reusable(self):
+        rules = RuleSet(RULES)
+        self.assertEqual(len(rules), 4)
+        for _ in range(3):
+            x = application(term=6)
+            self.assertEqual(len(Overwriter.trigger(rules, 'pricing', x)), 1)
+            self.assertEqual(x.tna, 0.4)
+
+    def test_immutable(self):
+        rules = RuleSet(RULES)
+        with self.assertRaises(AttributeError):
+            rules.rules = ()
+        with self.assertRaises(TypeError):
+            rules.rules[0].ops['='] = {}
+        self.assertEqual(rules.rules[0].ops['+']['fee'], (10,))
+
+    def test_index(self):
+        rules = RuleSet(RULES)
+        self.assertEqual(sorted(rules.events), ['eligibility', 'pricing'])
+        self.assertEqual([len(rules.events['pricing']), len(rules.callbacks['cmp'])], [3, 3])
+        x = application(code='B', term=13)
+        response = Overwriter.trigger_many(rules, ['pricing', 'eligibility', 'other'], x)
+        self.assertEqual(response, {
+            'pricing': ['pricing.between(term, 12..24): fee*2'],
+            'eligibility': ['eligibility.cmp(code=B): max_ltv<0.5 0.6'],
+            'other': [],
+        })
+        self.assertEqual((x.fee, x.max_ltv), (200, 0.5))
+
+
+class CallbackOverride(TestCase):
+    def test_override(self):
+        rules = RuleSet(RULES)
+        self.assertEqual(len(Overwriter.trigger(RULES, 'pricing', application())), 2)
+        try:
+            Overwriter.add(lambda x_, *args, **kwargs: False, 'cmp')
+            Overwriter.add(lambda x_, *args, **kwargs: False, 'between')
+            x = application()
+            self.assertEqual(Overwriter.trigger(RULES, 'pricing', x), [])
+            self.assertEqual(rules.trigger('pricing', x), [])
+            self.assertEqual((x.tna, x.fee), (0.5, 100))
+        finally:
+            Overwriter.add(f_cmp, 'cmp')
+            Overwriter.add(f_between, 'between')
+        self.assertEqual(len(rules.trigger('pricing', application())), 2)
+
+
+class CompiledConditions(TestCase):
+    def test_same_as_callbacks(self):
+        rules = [
+            'cmp(code=A, term.gte=12)', 'cmp(term.lt=12)', 'cmp(term.neq=12)', 'cmp(missing.neq=12)',
+            'cmp(missing.gt=1)', 'cmp(code.in=ABC)', 'cmp(code.notin=XYZ)', 'cmp(tags.has=new)',
+            'cmp(tags.hasnt=new)', 'cmp(term.btw=6..13)', 'cmp(term.btw=..7)', 'cmp(term.btw=24..)',
+            'cmp(term.btw=6)', 'cmp(term.btw=x..3)', 'cmp(product.code=X)', 'cmp(product.code.eq=X)',
+            'between(term, 6..13)', 'between(term, 12)', 'between(product.term, 6..)',
+            'not(cmp, code=A)', 'not(between, term, 1..7)',
+        ]
+        readables = [
+            application(tags=['new']),
+            application(code='X', term=6, tags=[], product=SimpleNamespace(code='X', term=7)),
+            application(code=None, term=None, tags=None),
+        ]
+        for rule in rules:
+            w = Overwriter(f'event.{rule}: fee=1')
+            for x in readables:
+                try:
+                    want = w.callback(x, *w.args, **w.kwargs)
+                except (AttributeError, TypeError) as e:
+                    with self.assertRaises(type(e)):
+                        w.ask(x)
+                    continue
+                self.assertEqual(w.ask(x), want, (rule, x))
+
+
+class SharedConditions(TestCase):
+    RULES = """
+    pricing.cmp(code=A, term.gte=12): tna=0.3
+    pricing.cmp(term.gte=12, code=A, fee.lt=50): fee+1
+    pricing.cmp(code=A, term.gte=12): fee=40
+    pricing.cmp(code=A, term.gte=12, fee.lt=50): fee+1
+    pricing.cmp(code=B, term.gte=12): tna=0.1
+    pricing.not(cmp, code=B): max_ltv=0.7
+    pricing.not(cmp, code=B): max_ltv*2
+    """
+
+    def test_shared(self):
+        rules = RuleSet(self.RULES)
+        x = application(term=24)
+        response = rules.trigger('pricing', x)
+        self.assertEqual(len(response), 5)
+        self.assertEqual((x.tna, x.fee, x.max_ltv), (0.3, 41, 1.4))
+
+        miss = application(code='C')
+        before = rules.saved
+        self.assertEqual(rules.trigger('pricing', miss, [SimpleNamespace()]), [
+            'pricing.not(cmp, code=B): max_ltv=0.7', 'pricing.not(cmp, code=B): max_ltv*2',
+        ])
+        self.assertEqual(rules.saved - before, 7)     # term.gte=12 on 4 rules, code=A on 3
+
+    def test_threads(self):
+        rules = RuleSet(self.RULES)
+        rules.trigger('pricing', application(code='C'), [SimpleNamespace()])
+        once = (rules.evaluations, rules.saved)
+        rules = RuleSet(self.RULES)
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda _: rules.trigger('pricing', application(code='C'), [SimpleNamespace()]), range(400)))
+        self.assertEqual((rules.evaluations, rules.saved), (400 * once[0], 400 * once[1]))
+
+    def test_positional_cmp(self):
+        rules = RuleSet('pricing.cmp(gold): tna*0.5')
+        x = application(segment='silver')
+        with self.assertRaises(TypeError):
+            rules.trigger('pricing', x)
+        self.assertEqual(x.tna, 0.5)
+
+    def test_tree(self):
+        tree = RuleSet(self.RULES).trees['pricing']
+        self.assertEqual(tree.paths[0], tree.paths[2])
+        self.assertEqual(tree.paths[1], tree.paths[3])
+        self.assertEqual(tree.paths[1][:2], tree.paths[0])
+
+
+class Batch(TestCase):
+    RULES = """
+    pricing.cmp(code=A, term.gte=12): tna=0.3, fee+10
+    pricing.cmp(code=A, term.lt=12): tna=0.4
+    pricing.between(term, 12..24): fee*1.5
+    pricing.cmp(fee.gt=150, term.btw=..30): max_ltv<0.5 $b.tna
+    pricing.not(cmp, code=A): fee-$w.term, code=C
+    pricing.cmp(code.in=BC): tags|new
+    pricing.cmp(tags.has=new, missing.neq=1): tna>0.6
+    """
+
+    def applications(self):
+        return [
+            application(code=code, term=term, fee=fee, tags=[])
+            for code in ['A', 'B', None] for term in [6, 12, 24, 36] for fee in [100, 140]
+        ]
+
+    def test_objects(self):
+        want = self.applications()
+        responses = [Overwriter.trigger(self.RULES, 'pricing', x) for x in want]
+        got = self.applications()
+        self.assertEqual(trigger_batch(self.RULES, 'pricing', got), responses)
+        self.assertEqual([vars(x) for x in got], [vars(x) for x in want])
+
+        # a write has to be seen by the aliases and properties read after it
+        for rules, new in [
+            ('e.cmp(a.gte=0): origination_pct=0.05\ne.cmp(a.gte=0.05): serv=10', lambda: [Expense(), Expense()]),
+            ('e.cmp(dbl.gte=0): k=5\ne.cmp(dbl.gte=10): hit=1', lambda: [Doubled(k=1), Doubled(k=2)]),
+        ]:
+            want, got = new(), new()
+            responses = [Overwriter.trigger(rules, 'e', x) for x in want]
+            self.assertEqual(len(responses[0]), 2)
+            self.assertEqual(trigger_batch(rules, 'e', got), responses)
+            self.assertEqual([x.__getstate__() if isinstance(x, Expense) else vars(x) for x in got],
+                             [x.__getstate__() if isinstance(x, Expense) else vars(x) for x in want])
+
+    def test_int_overflow(self):
+        rules = 'e.cmp(): v+9223372036854775807'
+        want, got = [application(v=2**62), application(v=1)], [application(v=2**62), application(v=1)]
+        responses = [Overwriter.trigger(rules, 'e', x) for x in want]
+        self.assertEqual(trigger_batch(rules, 'e', got), responses)
+        self.assertEqual([x.v for x in got], [13835058055282163711, 9223372036854775808])
+        self.assertEqual([x.v for x in got], [x.v for x in want])
+
+    def test_columns(self):
+        want = self.applications()
+        responses = [Overwriter.trigger(self.RULES, 'pricing', x) for x in want]
+        got = self.applications()
+        columns = {key: numpy.array([getattr(x, key) for x in got]) for key in ['term', 'fee', 'tna', 'max_ltv']}
+        columns['code'] = numpy.array([x.code for x in got], dtype=object)
+        columns['tags'] = numpy.empty(len(got), dtype=object)
+        columns['tags'][:] = [[] for _ in got]
+        self.assertEqual(trigger_batch(self.RULES, 'pricing', columns), responses)
+        for key in ['term', 'fee', 'tna', 'max_ltv', 'code', 'tags']:
+            self.assertEqual(list(columns[key]), [getattr(x, key) for x in want], key)
+
+
+    def test_python_values(self):
+        rules = """
+        pricing.cmp(code=A): fee*2.787, tna+1, max_ltv<1
+        pricing.cmp(fee.gt=149.104): term=1
+        """
+        want = [application(fee=53.5, tna=1), application(fee=100, tna=0.5), application(fee=7, max_ltv=2)]
+        responses = [Overwriter.trigger(rules, 'pricing', x) for x in want]
+        got = [application(fee=53.5, tna=1), application(fee=100, tna=0.5), application(fee=7, max_ltv=2)]
+        self.assertEqual(trigger_batch(rules, 'pricing', got), responses)
+        self.assertEqual(got[0].fee, 149.105)
+        for x, y in zip(got, want):
+            self.assertEqual([(k, type(v), v) for k, v in vars(x).items()],
+                             [(k, type(v), v) for k, v in vars(y).items()])
+
+
+class Profiling(TestCase):
+    def tearDown(self):
+        Overwriter.profiler = None
+
+    def test_profiler(self):
+        traces = []
+        Overwriter.profiler = Profiler(trace=lambda *x: traces.append(x))
+        for term in [6, 12, 36]:
+            Overwriter.trigger(RULES, 'pricing', application(term=term))
+        stats = Overwriter.profiler.stats['pricing.cmp(code=A, term.gte=12): tna=0.3, fee+10']
+        self.assertEqual((stats.evaluations, stats.matches), (3, 2))
+        self.assertEqual(len(traces), 9)
+        self.assertEqual(traces[0][:3], ('pricing.cmp(code=A, term.gte=12): tna=0.3, fee+10', 'pricing', False))
+        hot = Overwriter.profiler.hot(key='matches')
+        self.assertEqual([x.matches for _, x in hot], [2, 1, 1])
+        self.assertEqual(len(Overwriter.profiler.report(n=2).splitlines()), 3)
+
+
+class RuleCache(TestCase):
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            path = RuleSet.cache_path(RULES, cache_dir)
+            first = RuleSet.load(RULES, cache_dir)
+            self.assertTrue(os.path.exists(path))
+            with mock.patch.object(Overwriter, '_parse', side_effect=AssertionError('parsed')):
+                cached = RuleSet.load(RULES, cache_dir)
+            self.assertEqual([w.item() for w in cached], [w.item() for w in first])
+            x = application()
+            self.assertEqual(len(Overwriter.trigger(cached, 'pricing', x)), 2)
+            self.assertEqual((x.tna, x.fee), (0.3, 220))
+
+            with open(path, 'wb') as f:
+                f.write(b'garbage')
+            self.assertEqual([w.item() for w in RuleSet.load(RULES, cache_dir)], [w.item() for w in first])
+            with open(path, 'rb') as f:
+                self.assertNotEqual(f.read(), b'garbage')
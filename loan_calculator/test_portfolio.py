@@ -0,0 +1,42 @@
+import numpy
+
+from unittest import TestCase, mock
+from .calculator import Product
+from .portfolio import COLUMNS, iter_projection, project
+from .test_calculator import EXPENSES
+
+
+def naive(loans, horizon):
+    totals = numpy.zeros((horizon, len(COLUMNS)))
+    for product, k, n, age in loans:
+        for i, x in enumerate(product.repayment_plan(k, n)[age:age + horizon]):
+            totals[i] += [x.amount, x.interest, x.capital, x.life + x.fire, x.tax]
+    return totals
+
+
+class Projection(TestCase):
+    def setUp(self):
+        french = Product(tna=0.45, collateral=2e6, **EXPENSES)
+        american = Product(tna=0.30, collateral=1e6, depreciation='AM', **EXPENSES)
+        rng = numpy.random.default_rng(0)
+        self.loans = [
+            (rng.choice([french, american]), rng.uniform(1e4, 1e6), int(rng.choice([12, 24, 36])), int(rng.integers(0, 12)))
+            for _ in range(300)
+        ]
+
+    def test_project(self):
+        want = naive(self.loans, 30)
+        got = project(self.loans, 30, chunksize=70, processes=0)
+        for i, column in enumerate(COLUMNS):
+            numpy.testing.assert_allclose(got[column], want[:, i], rtol=1e-9)
+
+    def test_stream_in_processes(self):
+        partial = list(iter_projection(self.loans, 30, chunksize=100, processes=2))
+        self.assertEqual(partial[-1][0], len(self.loans))
+        self.assertEqual(sorted(done for done, _ in partial), [done for done, _ in partial])
+        numpy.testing.assert_allclose(partial[-1][1], naive(self.loans, 30), rtol=1e-9)
+
+    def test_unknown_cpu_count(self):
+        with mock.patch('os.cpu_count', return_value=None):
+            partial = list(iter_projection(self.loans[:50], 30, chunksize=20))
+        numpy.testing.assert_allclose(partial[-1][1], naive(self.loans[:50], 30), rtol=1e-9)